@@ -0,0 +1,53 @@
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Room
+
+
+class ActivityTracker:
+    """Keeps ``Room.last_activity`` current without a write on every poll.
+
+    :meth:`touch` writes at most once per ``interval`` seconds per room and
+    process, so ``last_activity`` lags real use by no more than ``interval``.
+    """
+
+    def __init__(self, interval=60.0, max_rooms=4096, clock=time.monotonic):
+        self.interval = interval
+        self.max_rooms = max_rooms
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._written = {}
+
+    def touch(self, code):
+        """Record that room ``code`` is in use; True if this call wrote to the database."""
+        if not self._due(code):
+            return False
+        Room.objects.filter(code=code).update(last_activity=timezone.now())
+        return True
+
+    async def atouch(self, code):
+        if not self._due(code):
+            return False
+        await Room.objects.filter(code=code).aupdate(last_activity=timezone.now())
+        return True
+
+    def _due(self, code):
+        with self._lock:
+            now = self._clock()
+            written = self._written.get(code)
+            if written is not None and now - written < self.interval:
+                return False
+            self._written[code] = now
+            while len(self._written) > self.max_rooms:
+                del self._written[next(iter(self._written))]
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._written.clear()
+
+
+room_activity = ActivityTracker(interval=getattr(settings, 'ROOM_ACTIVITY_WRITE_INTERVAL', 60.0))
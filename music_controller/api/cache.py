@@ -0,0 +1,129 @@
+import threading
+import time
+
+from django.conf import settings
+
+from music_controller.shared_state import shared_state
+from .activity import room_activity
+from .changes import room_changes
+from .models import Room
+
+
+class RoomCache:
+    """Per-room memo of rows read on every poll (the room itself, vote tallies).
+
+    Each room holds any number of parts, loaded on demand and kept for ``ttl``
+    seconds. Writes made in this process drop the whole room at once through
+    :meth:`invalidate`, which also calls ``on_invalidate(code)``; writes made by
+    other processes show up within ``ttl``.
+    """
+
+    def __init__(self, ttl=1.0, max_rooms=4096, on_invalidate=None, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_rooms = max_rooms
+        self.on_invalidate = on_invalidate
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rooms = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, code, part, load):
+        """Return ``part`` of room ``code``, reusing the value ``load()`` returned for ``ttl`` seconds."""
+        found, value, parts = self._lookup(code, part)
+        if found:
+            return value
+        value = load()
+        self._store(code, parts, part, value)
+        return value
+
+    async def aget(self, code, part, load):
+        """Like :meth:`get` for a coroutine function ``load``."""
+        found, value, parts = self._lookup(code, part)
+        if found:
+            return value
+        value = await load()
+        self._store(code, parts, part, value)
+        return value
+
+    def _lookup(self, code, part):
+        with self._lock:
+            parts = self._rooms.get(code)
+            if parts is None:
+                parts = self._rooms[code] = {}
+                while len(self._rooms) > self.max_rooms:
+                    del self._rooms[next(iter(self._rooms))]
+            entry = parts.get(part)
+            if entry is not None and self._clock() - entry[1] < self.ttl:
+                self.hits += 1
+                return True, entry[0], parts
+            self.misses += 1
+            return False, None, parts
+
+    def _store(self, code, parts, part, value):
+        with self._lock:
+            # An invalidation during load() replaced the room's dict; keep the value out of it.
+            if self._rooms.get(code) is parts:
+                parts[part] = (value, self._clock())
+
+    def invalidate(self, code):
+        """Drop everything cached for room ``code``."""
+        self.discard(code)
+        if self.on_invalidate is not None:
+            self.on_invalidate(code)
+
+    def discard(self, code):
+        """Drop room ``code`` without calling ``on_invalidate``, e.g. for a change another process announced."""
+        with self._lock:
+            self._rooms.pop(code, None)
+
+    def clear(self):
+        """Drop every cached room and reset the counters."""
+        with self._lock:
+            self._rooms.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached rooms."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'rooms': len(self._rooms)}
+
+
+def room_changed(code):
+    """Wake this process's waiters on room ``code`` and tell the other workers to drop their copy."""
+    room_changes.notify(code)
+    shared_state.put('room', code)
+
+
+def room_changed_elsewhere(code, value=None):
+    room_cache.discard(code)
+    room_changes.notify(code)
+
+
+room_cache = RoomCache(ttl=getattr(settings, 'ROOM_CACHE_TTL', 1.0), on_invalidate=room_changed)
+shared_state.subscribe('room', room_changed_elsewhere)
+
+
+def cached_room(code):
+    """Return the room with ``code`` through :data:`room_cache`, or None.
+
+    Members reach their room through here, so a found room also counts as active.
+    """
+    if not code:
+        return None
+    shared_state.ensure_started()
+    room = room_cache.get(code, 'room', lambda: Room.objects.filter(code=code).first())
+    if room is not None:
+        room_activity.touch(code)
+    return room
+
+
+async def acached_room(code):
+    """Async :func:`cached_room`; a warm cache answers without leaving the event loop."""
+    if not code:
+        return None
+    shared_state.ensure_started()
+    room = await room_cache.aget(code, 'room', lambda: Room.objects.filter(code=code).afirst())
+    if room is not None:
+        await room_activity.atouch(code)
+    return room
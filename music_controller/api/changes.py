@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class RoomChanges:
+    """Per-room change counters that coroutines can wait on.
+
+    Anything that may alter what a room's listeners see (settings, votes, a new
+    playback poll) calls :meth:`notify` from any thread. Waiters read
+    :meth:`seq` before computing the state they hand out, then :meth:`wait` for
+    it to move on, so a change that lands in between is never missed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = {}
+        self._waiters = {}
+
+    def seq(self, code):
+        with self._lock:
+            return self._seq.get(code, 0)
+
+    def notify(self, code):
+        with self._lock:
+            self._seq[code] = self._seq.get(code, 0) + 1
+            waiters = self._waiters.pop(code, ())
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def forget(self, code):
+        """Wake everyone waiting on a deleted room and drop its counter."""
+        self.notify(code)
+        with self._lock:
+            self._seq.pop(code, None)
+
+    async def wait(self, code, seen, timeout):
+        """Wait up to ``timeout`` seconds for ``code`` to change after ``seen``; True if it did."""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            if self._seq.get(code, 0) != seen:
+                return True
+            self._waiters.setdefault(code, []).append(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(code)
+                if waiters and waiter in waiters:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del self._waiters[code]
+
+
+room_changes = RoomChanges()
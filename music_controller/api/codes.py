@@ -0,0 +1,96 @@
+import hashlib
+import hmac
+import string
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+
+ALPHABET = string.ascii_uppercase
+CODE_LENGTH = 6
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+_HALF_BITS = 15  # A 30-bit Feistel network covers the 26**6 code space.
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+
+
+def _round(key, i, value):
+    digest = hmac.new(key, bytes([i]) + value.to_bytes(2, 'big'), hashlib.sha256).digest()
+    return int.from_bytes(digest[:2], 'big') & _HALF_MASK
+
+
+def permute(n, key):
+    """Map ``n`` in ``[0, CODE_SPACE)`` to a distinct, unpredictable index in the same range.
+
+    A keyed Feistel network is a permutation of 30-bit integers; cycle walking
+    keeps the result inside the code space.
+    """
+    x = n
+    while True:
+        left, right = x >> _HALF_BITS, x & _HALF_MASK
+        for i in range(_ROUNDS):
+            left, right = right, left ^ _round(key, i, right)
+        x = (left << _HALF_BITS) | right
+        if x < CODE_SPACE:
+            return x
+
+
+def encode(index):
+    """Spell a code-space index as ``CODE_LENGTH`` uppercase letters."""
+    letters = []
+    for _ in range(CODE_LENGTH):
+        index, digit = divmod(index, len(ALPHABET))
+        letters.append(ALPHABET[digit])
+    return ''.join(reversed(letters))
+
+
+class CodeAllocator:
+    """Hands out unique room codes from a keyed permutation of a shared sequence.
+
+    Sequence numbers are reserved from the database in blocks, so most codes cost
+    no query at all. Codes already taken by rooms created before the allocator
+    (random legacy codes) are skipped with one query per block.
+    """
+
+    def __init__(self, key, block_size=64):
+        self.key = key
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pool = []
+
+    def allocate(self):
+        return self.allocate_many(1)[0]
+
+    def allocate_many(self, count):
+        with self._lock:
+            while len(self._pool) < count:
+                self._pool.extend(self._reserve(max(self.block_size, count - len(self._pool))))
+            codes, self._pool = self._pool[:count], self._pool[count:]
+        return codes
+
+    def _reserve(self, count):
+        from .models import Room, RoomCodeSequence
+
+        with transaction.atomic():
+            sequence = RoomCodeSequence.objects.filter(pk=1)
+            if not sequence.update(next_value=F('next_value') + count):
+                RoomCodeSequence.objects.get_or_create(pk=1)
+                sequence.update(next_value=F('next_value') + count)
+            end = RoomCodeSequence.objects.values_list('next_value', flat=True).get(pk=1)
+        start = end - count
+        if end > CODE_SPACE:
+            raise RuntimeError("Room code space exhausted.")
+
+        codes = [encode(permute(n, self.key)) for n in range(start, end)]
+        taken = set(Room.objects.filter(code__in=codes).values_list('code', flat=True))
+        return [code for code in codes if code not in taken]
+
+
+def _default_key():
+    key = getattr(settings, 'ROOM_CODE_KEY', None) or settings.SECRET_KEY
+    return hashlib.sha256(b'room-codes:' + key.encode()).digest()
+
+
+code_allocator = CodeAllocator(_default_key(), block_size=getattr(settings, 'ROOM_CODE_BLOCK_SIZE', 64))
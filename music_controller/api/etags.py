@@ -0,0 +1,38 @@
+import hashlib
+import json
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+
+def state_version(*parts):
+    """Short digest of the JSON-serialisable ``parts`` that define a response."""
+    return hashlib.blake2b(json.dumps(parts, default=str).encode(), digest_size=10).hexdigest()
+
+
+def make_etag(*parts):
+    """Weak ETag over ``parts``, carrying their :func:`state_version`."""
+    return f'W/"{state_version(*parts)}"'
+
+
+def etag_version(value):
+    """The version inside an ETag, accepting the bare version as well."""
+    value = value.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    return value.strip('"')
+
+
+def not_modified(request, etag):
+    """Return a 304 if the request's ``If-None-Match`` already names ``etag``, else None."""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        tag_response(response, etag)
+    return response
+
+
+def tag_response(response, etag):
+    """Attach ``etag`` and make clients revalidate instead of reusing the body unasked."""
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ('Cookie', 'X-Room-Token'))  # Tagged state depends on who is asking.
+    return response
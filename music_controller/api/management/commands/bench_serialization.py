@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.renderers import orjson
+from api.serialization_bench import run
+
+
+class Command(BaseCommand):
+    help = "Compare CPU per call of DRF serializers/rendering with the fast Room and now-playing paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{options['iterations']} calls per case, orjson {'installed' if orjson else 'not installed'}")
+        self.stdout.write(f"{'case':<20}{'before us':>11}{'after us':>10}{'speedup':>9}")
+        for name, before, after in run(options['iterations']):
+            self.stdout.write(f"{name:<20}{before * 1e6:>11.2f}{after * 1e6:>10.2f}{before / after if after else 0:>8.1f}x")
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import get_random_string
+
+
+SALT = 'api.room-membership'
+COOKIE_NAME = 'room_token'
+HEADER = 'HTTP_X_ROOM_TOKEN'
+
+_UNSET = object()
+
+
+def tokens_enabled():
+    """Whether room membership travels in signed tokens (``ROOM_MEMBERSHIP_TOKENS``)."""
+    return getattr(settings, 'ROOM_MEMBERSHIP_TOKENS', False)
+
+
+def token_max_age():
+    return getattr(settings, 'ROOM_MEMBERSHIP_TOKEN_MAX_AGE', settings.SESSION_COOKIE_AGE)
+
+
+def issue_token(room_code, user):
+    """Sign ``room_code`` and the member's ``user`` id into an expiring token."""
+    return signing.dumps({'room': room_code, 'user': user}, salt=SALT, compress=True)
+
+
+def read_token(request):
+    """Return the ``{'room', 'user'}`` claims of the request's token, or None if absent or invalid."""
+    claims = getattr(request, '_room_membership', _UNSET)
+    if claims is _UNSET:
+        claims = None
+        token = request.META.get(HEADER) or request.COOKIES.get(COOKIE_NAME)
+        if token and tokens_enabled():
+            try:
+                claims = signing.loads(token, salt=SALT, max_age=token_max_age())
+            except signing.BadSignature:
+                pass
+        request._room_membership = claims
+    return claims
+
+
+def get_room_code(request):
+    """The caller's room: from its token when tokens are enabled, else from the session."""
+    claims = read_token(request)
+    if claims is not None:
+        return claims['room']
+    return request.session.get('room_code')
+
+
+async def aget_room_code(request):
+    claims = read_token(request)
+    if claims is not None:
+        return claims['room']
+    return await request.session.aget('room_code')
+
+
+def get_user_id(request):
+    """The caller's identity (a session key) for host checks and votes; never queries the session table."""
+    claims = read_token(request)
+    if claims is not None:
+        return claims['user']
+    return request.session.session_key
+
+
+def new_user_id():
+    """An identity for a guest that has no session, shaped like a session key."""
+    return get_random_string(32, 'abcdefghijklmnopqrstuvwxyz0123456789')
+
+
+def set_token(response, room_code, user):
+    """Hand the client a token for ``room_code`` as a cookie and in ``X-Room-Token``."""
+    token = issue_token(room_code, user)
+    response.set_cookie(COOKIE_NAME, token, max_age=token_max_age(), httponly=True, samesite='Lax',
+                        secure=settings.SESSION_COOKIE_SECURE)
+    response['X-Room-Token'] = token
+    return response
+
+
+def clear_token(response):
+    response.delete_cookie(COOKIE_NAME, samesite='Lax')
+    return response
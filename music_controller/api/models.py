@@ -1,16 +1,20 @@
-from django.db import models
-import random
-import string
+from django.db import models, transaction
+from django.utils import timezone
+from .codes import code_allocator
 
 def generate_unique_code():
-    length = 6
+    return code_allocator.allocate()
 
-    while True:
-        code = ''.join(random.choices(string.ascii_uppercase, k=length))
-        if Room.objects.filter(code=code).count() == 0:
-            break
 
-    return code
+def bulk_create_rooms(hosts, guest_can_pause=False, votes_to_skip=1):
+    """Create one room per host, with freshly allocated codes, in a single transaction."""
+    hosts = list(hosts)
+    codes = code_allocator.allocate_many(len(hosts))
+    with transaction.atomic():
+        return Room.objects.bulk_create(
+            Room(host=host, code=code, guest_can_pause=guest_can_pause, votes_to_skip=votes_to_skip)
+            for host, code in zip(hosts, codes)
+        )
 
 # Create your models here.
 class Room(models.Model):
@@ -20,3 +24,17 @@ class Room(models.Model):
     votes_to_skip = models.IntegerField(null=False, default=1)
     created_at = models.DateTimeField(auto_now_add=True)
     current_song = models.CharField(max_length=50, null=True)
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Cursor pages of RoomView, all rooms and active rooms only.
+            models.Index(fields=['created_at', 'id'], name='room_created_idx'),
+            models.Index(fields=['created_at', 'id'], condition=models.Q(current_song__isnull=False),
+                         name='room_active_created_idx'),
+        ]
+
+
+class RoomCodeSequence(models.Model):
+    """Single-row counter that room codes are permuted from."""
+    next_value = models.BigIntegerField(default=0)
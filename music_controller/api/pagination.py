@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class RoomCursorPagination(CursorPagination):
+    """Newest rooms first, paged by an opaque cursor over ``(created_at, id)``.
+
+    Each page is one indexed range read, however deep the client pages.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -0,0 +1,46 @@
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Optional: without it everything falls back to the standard json module.
+    orjson = None
+
+
+_fallback = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes for ``data``, through orjson when it is installed.
+
+    Types orjson does not know (lazy strings, Decimal, querysets...) go through
+    DRF's encoder, so the output matches what :class:`JSONRenderer` produces.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_fallback.default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    return _fallback.encode(data).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """DRF's JSON renderer, rendering compact output with orjson when it is installed.
+
+    Indented output (``Accept: application/json; indent=4`` or the browsable
+    API) and the non-default ``UNICODE_JSON``/``COMPACT_JSON`` settings still
+    go through :class:`JSONRenderer`.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or not self.compact or self.ensure_ascii or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """Like :class:`django.http.JsonResponse` for dicts, without DRF content negotiation, via :func:`dumps`."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,69 @@
+import time
+
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+
+from .models import Room
+from .renderers import FastJSONRenderer, FastJsonResponse, dumps
+from .serializers import RoomSerializer, room_fields
+
+
+SONG = {
+    'title': 'Harvest Moon', 'artist': 'Neil Young', 'duration': 303000, 'time': 81234,
+    'timestamp': 1760000000000, 'image_url': 'https://i.scdn.co/image/ab67616d0000b273abcdef0123456789',
+    'is_playing': True, 'votes': 1, 'votes_required': 3, 'id': '4oFFkq1fMxdwb3C0V5Yh8Y',
+    'version': 1760000000000, 'next_poll_ms': 15000,
+}
+
+
+class _DRFSong(APIView):
+    renderer_classes = [JSONRenderer]
+
+    def get(self, request):
+        return Response(SONG)
+
+
+class _FastSong(APIView):
+    def get(self, request):
+        return FastJsonResponse(SONG)
+
+
+def _render(view, request):
+    response = view(request)
+    if hasattr(response, 'render'):
+        response.render()
+    return response.content
+
+
+def cases():
+    """``(name, before, after)`` pairs of zero-argument callables producing the same result."""
+    room = Room(id=1, code='ABCDEF', host='k' * 32, guest_can_pause=True, votes_to_skip=3, created_at=timezone.now())
+    room_data = RoomSerializer(room).data
+    request = APIRequestFactory().get('/spotify/current-song')
+    drf_view, fast_view = _DRFSong.as_view(), _FastSong.as_view()
+    return [
+        ('room -> dict', lambda: RoomSerializer(room).data, lambda: room_fields.instance(room)),
+        ('room dict -> json', lambda: JSONRenderer().render(room_data), lambda: FastJSONRenderer().render(room_data)),
+        ('song -> json', lambda: JSONRenderer().render(SONG), lambda: dumps(SONG)),
+        ('song response', lambda: _render(drf_view, request), lambda: _render(fast_view, request)),
+    ]
+
+
+def cpu_per_call(func, iterations):
+    """Mean process CPU seconds per call of ``func`` over ``iterations`` calls."""
+    started = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - started) / iterations
+
+
+def run(iterations=20000):
+    """CPU per call for each case, before and after: ``[(name, before, after), ...]``."""
+    rows = []
+    for name, before, after in cases():
+        before(), after()  # Warm up lazy imports and caches.
+        rows.append((name, cpu_per_call(before, iterations), cpu_per_call(after, iterations)))
+    return rows
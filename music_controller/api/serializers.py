@@ -1,6 +1,12 @@
+from operator import attrgetter, itemgetter
+
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
+
 from .models import Room
 
+
 class RoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = Room
@@ -16,3 +22,52 @@ class UpdateRoomSerializer(serializers.ModelSerializer):
     class Meta:
         model = Room
         fields = ('guest_can_pause', 'votes_to_skip', 'code')
+
+
+def iso_datetime(value):
+    """A datetime as DRF's DateTimeField renders it: ISO 8601 in the current time zone, UTC as ``Z``."""
+    if value is None:
+        return None
+    if settings.USE_TZ:
+        value = value.astimezone(timezone.get_current_timezone()) if timezone.is_aware(value) else timezone.make_aware(value)
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class FieldExtractor:
+    """Plain dicts of a fixed field list, from model instances or ``values()`` rows.
+
+    The getters are built once, so each call is a tuple fetch and a zip rather
+    than a walk over serializer fields. ``converters`` maps field names to
+    functions for values JSON cannot carry as they are (datetimes).
+    """
+
+    def __init__(self, fields, converters=None):
+        self.fields = tuple(fields)
+        self.converters = dict(converters or {})
+        self._attrs = attrgetter(*self.fields)
+        self._items = itemgetter(*self.fields)
+        self._converters = tuple(self.converters.items())
+        if len(self.fields) == 1:
+            attrs, items = self._attrs, self._items
+            self._attrs = lambda obj: (attrs(obj),)
+            self._items = lambda row: (items(row),)
+
+    def only(self, fields):
+        """An extractor for a subset of ``fields``, converting them the same way."""
+        return FieldExtractor(fields, {field: convert for field, convert in self.converters.items() if field in fields})
+
+    def instance(self, obj):
+        return self._convert(dict(zip(self.fields, self._attrs(obj))))
+
+    def row(self, row):
+        return self._convert(dict(zip(self.fields, self._items(row))))
+
+    def _convert(self, data):
+        for field, convert in self._converters:
+            data[field] = convert(data[field])
+        return data
+
+
+# Same output as RoomSerializer(room).data for the hot single-room responses.
+room_fields = FieldExtractor(RoomSerializer.Meta.fields, {'created_at': iso_datetime})
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import room_cache
+from .changes import room_changes
+from .models import Room
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_cached_room(sender, instance, **kwargs):
+    room_cache.invalidate(instance.code)
+
+
+@receiver(post_delete, sender=Room)
+def forget_room_changes(sender, instance, **kwargs):
+    room_changes.forget(instance.code)
@@ -1,3 +1,209 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .activity import ActivityTracker
+from .cache import room_cache
+from .codes import CODE_SPACE, CodeAllocator, encode, permute
+from .membership import COOKIE_NAME, issue_token
+from .models import Room, RoomCodeSequence, bulk_create_rooms
+from .renderers import FastJSONRenderer, dumps
+from .serialization_bench import SONG, cases
+from .serializers import RoomSerializer, iso_datetime, room_fields
+
+
+def statements(captured):
+    return [q['sql'] for q in captured if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+
+
+class CodePermutationTests(SimpleTestCase):
+    def test_permutation_is_collision_free_and_in_range(self):
+        key = b'test-key'
+        indexes = [permute(n, key) for n in range(20000)]
+        self.assertEqual(len(set(indexes)), len(indexes))
+        self.assertTrue(all(0 <= index < CODE_SPACE for index in indexes))
+
+    def test_encode_spells_six_letters(self):
+        self.assertEqual(encode(0), 'AAAAAA')
+        self.assertEqual(encode(CODE_SPACE - 1), 'ZZZZZZ')
+
+
+class CodeAllocatorTests(TestCase):
+    def test_allocations_are_unique_and_mostly_query_free(self):
+        allocator = CodeAllocator(b'test-key', block_size=100)
+        with CaptureQueriesContext(connection) as captured:
+            codes = [allocator.allocate() for _ in range(250)]
+        self.assertEqual(len(set(codes)), 250)
+        self.assertLessEqual(len(statements(captured)), 12)
+
+    def test_codes_already_in_use_are_skipped(self):
+        allocator = CodeAllocator(b'test-key', block_size=10)
+        first = allocator.allocate_many(10)
+        Room.objects.create(host='legacy', code=first[3])
+
+        # Replay the same block, as a changed key or a legacy random code would.
+        RoomCodeSequence.objects.filter(pk=1).update(next_value=0)
+        replayed = CodeAllocator(b'test-key', block_size=10).allocate_many(9)
+        self.assertNotIn(first[3], replayed)
+        self.assertEqual(replayed, first[:3] + first[4:])
+
+    def test_bulk_create_rooms(self):
+        with CaptureQueriesContext(connection) as captured:
+            rooms = bulk_create_rooms([f'host-{i}' for i in range(50)], votes_to_skip=3)
+        self.assertEqual(len({room.code for room in rooms}), 50)
+        self.assertEqual(Room.objects.filter(votes_to_skip=3).count(), 50)
+        self.assertLessEqual(len(statements(captured)), 7)
+
+
+class MetricsTests(TestCase):
+    def test_requests_are_timed_per_route(self):
+        room = Room.objects.create(host='host')
+        self.client.get('/api/get-room', {'code': room.code})
+        body = self.client.get('/metrics').content.decode()
+
+        self.assertIn('http_request_duration_seconds_count{route="api/get-room",method="GET"}', body)
+        self.assertIn('http_requests_total{route="api/get-room",method="GET",status="200"}', body)
+        self.assertRegex(body, r'http_request_db_queries_sum\{route="api/get-room"\} [1-9]')
+        self.assertIn('now_playing_cache_hits_total', body)
+
+
+class ConditionalGetRoomTests(TestCase):
+    def setUp(self):
+        room_cache.clear()
+        self.addCleanup(room_cache.clear)
+        self.room = Room.objects.create(host='host', votes_to_skip=2)
+
+    def test_unchanged_room_is_answered_with_304_without_queries(self):
+        first = self.client.get('/api/get-room', {'code': self.room.code})
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/get-room', {'code': self.room.code}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_settings_change_changes_the_etag(self):
+        first = self.client.get('/api/get-room', {'code': self.room.code})
+        self.room.votes_to_skip = 3
+        self.room.save(update_fields=['votes_to_skip'])
+        second = self.client.get('/api/get-room', {'code': self.room.code}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['votes_to_skip'], 3)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+
+class RoomListingTests(TestCase):
+    def setUp(self):
+        self.rooms = [Room.objects.create(host=f'host-{i}', current_song='song' if i % 2 else None) for i in range(5)]
+
+    def test_cursor_pages_cover_every_room_newest_first(self):
+        codes, url = [], '/api/room?page_size=2&fields=code'
+        while url:
+            with self.assertNumQueries(1):
+                page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            codes.extend(row['code'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(codes, [room.code for room in reversed(self.rooms)])
+
+    def test_fields_are_projected(self):
+        results = self.client.get('/api/room', {'fields': 'code,votes_to_skip'}).json()['results']
+        self.assertEqual(set(results[0]), {'code', 'votes_to_skip'})
+        default = self.client.get('/api/room').json()['results'][0]
+        self.assertEqual(set(default), set(RoomSerializer.Meta.fields))
+        self.assertEqual(self.client.get('/api/room', {'fields': 'code,secret'}).status_code, 400)
+
+    def test_rows_match_get_room(self):
+        rows = {row['code']: row for row in self.client.get('/api/room').json()['results']}
+        for room in self.rooms:
+            detail = self.client.get('/api/get-room', {'code': room.code}).json()
+            del detail['is_host']
+            self.assertEqual(rows[room.code], detail)
+
+    def test_active_filter(self):
+        results = self.client.get('/api/room', {'active': 'true', 'fields': 'code'}).json()['results']
+        self.assertEqual({row['code'] for row in results}, {room.code for room in self.rooms if room.current_song})
+
+
+@override_settings(ROOM_MEMBERSHIP_TOKENS=True)
+class MembershipTokenTests(TestCase):
+    def setUp(self):
+        room_cache.clear()
+        self.addCleanup(room_cache.clear)
+        self.room = Room.objects.create(host='host-key')
+
+    def test_guests_poll_without_touching_the_session_table(self):
+        response = self.client.post('/api/join-room', {'code': self.room.code}, content_type='application/json')
+        self.assertIn(COOKIE_NAME, response.cookies)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get('/api/user-in-room').json()['code'], self.room.code)
+            self.assertFalse(self.client.get('/api/get-room', {'code': self.room.code}).json()['is_host'])
+        self.assertFalse([sql for sql in statements(captured) if 'django_session' in sql])
+
+    def test_header_token_identifies_the_host(self):
+        token = issue_token(self.room.code, 'host-key')
+        response = self.client.get('/api/get-room', {'code': self.room.code}, HTTP_X_ROOM_TOKEN=token)
+        self.assertTrue(response.json()['is_host'])
+
+    def test_tampered_and_expired_tokens_are_ignored(self):
+        token = issue_token(self.room.code, 'host-key')
+        self.assertIsNone(self.client.get('/api/user-in-room', HTTP_X_ROOM_TOKEN=token[:-1] + 'x').json()['code'])
+        with self.settings(ROOM_MEMBERSHIP_TOKEN_MAX_AGE=-1):
+            self.assertIsNone(self.client.get('/api/user-in-room', HTTP_X_ROOM_TOKEN=token).json()['code'])
+
+    def test_host_leaving_deletes_the_room_and_the_cookie(self):
+        self.client.cookies[COOKIE_NAME] = issue_token(self.room.code, 'host-key')
+        response = self.client.post('/api/leave-room')
+        self.assertEqual(response.cookies[COOKIE_NAME].value, '')
+        self.assertFalse(Room.objects.exists())
+
+
+class ActivityTrackerTests(TestCase):
+    def test_polls_write_last_activity_once_per_interval(self):
+        room = Room.objects.create(host='host', last_activity=timezone.now() - timedelta(hours=1))
+        clock = [0.0]
+        tracker = ActivityTracker(interval=60, clock=lambda: clock[0])
+        with self.assertNumQueries(1):
+            self.assertTrue(tracker.touch(room.code))
+            self.assertFalse(tracker.touch(room.code))
+        room.refresh_from_db()
+        self.assertLess(timezone.now() - room.last_activity, timedelta(minutes=1))
+        clock[0] = 61.0
+        self.assertTrue(tracker.touch(room.code))
+
+
+class FastSerializationTests(TestCase):
+    def test_room_fields_match_the_serializer(self):
+        room = Room.objects.create(host='host', guest_can_pause=True, votes_to_skip=4)
+        self.assertEqual(room_fields.instance(room), dict(RoomSerializer(room).data))
+        self.assertEqual(room_fields.row(Room.objects.values().get(pk=room.pk)), dict(RoomSerializer(room).data))
+
+    def test_datetimes_render_like_drf(self):
+        moment = timezone.now()
+        self.assertEqual(iso_datetime(moment), RoomSerializer().fields['created_at'].to_representation(moment))
+        with timezone.override('Europe/Paris'):
+            self.assertEqual(iso_datetime(moment), RoomSerializer().fields['created_at'].to_representation(moment))
+
+    def test_renderer_matches_drf(self):
+        data = {'song': SONG, 'at': timezone.now(), 'name': 'Sigur Rós', 'missing': None}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(dumps(SONG), JSONRenderer().render(SONG))
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_get_room_body_is_unchanged(self):
+        self.client.post('/api/create-room', {'guest_can_pause': True, 'votes_to_skip': 3}, content_type='application/json')
+        room = Room.objects.get()
+        response = self.client.get('/api/get-room', {'code': room.code})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json(), dict(RoomSerializer(room).data, is_host=True))
+
+    def test_benchmark_cases_agree(self):
+        for name, before, after in cases():
+            with self.subTest(name):
+                self.assertEqual(after(), before())
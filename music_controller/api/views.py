@@ -1,15 +1,46 @@
 from django.shortcuts import render
 from rest_framework import generics, status
 from .models import Room
-from .serializers import RoomSerializer, CreateRoomSerializer, UpdateRoomSerializer
+from .cache import cached_room
+from .etags import make_etag, not_modified, tag_response
+from .membership import clear_token, get_room_code, get_user_id, new_user_id, set_token, tokens_enabled
+from .pagination import RoomCursorPagination
+from .renderers import FastJsonResponse
+from .serializers import RoomSerializer, CreateRoomSerializer, UpdateRoomSerializer, room_fields
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.http import JsonResponse
 
 # Create your views here.
-class RoomView(generics.ListAPIView):  # Define a view for listing all Room objects
-    queryset = Room.objects.all()  # Set the queryset to all Room objects
-    serializer_class = RoomSerializer  # Set the serializer class to RoomSerializer
+class RoomView(generics.ListAPIView):  # Define a view for listing Room objects, a page at a time
+    serializer_class = RoomSerializer  # Fields a client may ask for
+    pagination_class = RoomCursorPagination  # Cursor pages ordered by created_at, id
+
+    def get_fields(self):
+        """The ``?fields=`` a client asked for, or every RoomSerializer field."""
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return list(RoomSerializer.Meta.fields)
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = set(fields) - set(RoomSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}."})
+        return fields
+
+    def get_queryset(self):
+        queryset = Room.objects.all()
+        if self.request.query_params.get('active') in ('1', 'true', 'True'):  # Rooms that have played a song
+            queryset = queryset.filter(current_song__isnull=False)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        # Plain dicts straight from the selected columns; the cursor needs created_at and id.
+        rows = self.get_queryset().values(*set(fields) | {'created_at', 'id'})
+        page = self.paginate_queryset(rows)
+        extract = room_fields.only(fields).row
+        return self.get_paginated_response([extract(row) for row in page])
 
 
 class GetRoom(APIView):  # Define a view for getting a Room
@@ -19,11 +50,16 @@ class GetRoom(APIView):  # Define a view for getting a Room
     def get(self, request, format=None):  # Define a GET method for the view
         code = request.GET.get(self.lookup_url_kwarg)  # Get the code from the URL
         if code is not None:  # Check if the code is not None
-            room = Room.objects.filter(code=code)  # Filter Room objects by code
-            if room.exists():  # Check if the Room exists
-                data = RoomSerializer(room.first()).data  # Serialize the Room data
-                data['is_host'] = self.request.session.session_key == room.first().host  # Add a boolean field for whether the current session is the host
-                return Response(data, status=status.HTTP_200_OK)  # Return the Room data
+            room = cached_room(code)  # Look up the Room, shared between pollers for a moment
+            if room is not None:  # Check if the Room exists
+                is_host = get_user_id(request) == room.host  # Whether the caller is the host
+                etag = make_etag(room.pk, room.code, room.guest_can_pause, room.votes_to_skip, is_host)
+                unchanged = not_modified(request, etag)  # Answer repeat polls without serializing
+                if unchanged is not None:
+                    return unchanged
+                data = room_fields.instance(room)  # Serialize the Room data (same fields as RoomSerializer)
+                data['is_host'] = is_host  # Add a boolean field for whether the current session is the host
+                return tag_response(FastJsonResponse(data, status=status.HTTP_200_OK), etag)  # Return the Room data
             return Response({'Room Not Found': 'Invalid Room Code.'}, status=status.HTTP_404_NOT_FOUND)  # Return an error response if the Room does not exist
         return Response({'Bad Request': 'Code parameter not found in request'}, status=status.HTTP_400_BAD_REQUEST)  # Return an error response if the code is None
 
@@ -32,16 +68,23 @@ class JoinRoom(APIView):  # Define a view for joining a Room
     lookup_url_kwarg = 'code'  # Set the lookup URL keyword argument to 'code'
 
     def post(self, request, format=None):
-        if not self.request.session.exists(self.request.session.session_key):
-            self.request.session.create()
+        if tokens_enabled():  # Guests are identified by their token; no session row needed
+            user = get_user_id(request) or new_user_id()
+        else:
+            if not self.request.session.exists(self.request.session.session_key):
+                self.request.session.create()
+            user = self.request.session.session_key
         
         code = request.data.get(self.lookup_url_kwarg)
         if code != None:
             room_results = Room.objects.filter(code=code)
             if len(room_results) > 0:
                 room = room_results[0]
+                response = Response({'message': 'Room Joined!'}, status=status.HTTP_200_OK)
+                if tokens_enabled():
+                    return set_token(response, code, user)
                 self.request.session['room_code'] = code
-                return Response({'message': 'Room Joined!'}, status=status.HTTP_200_OK)
+                return response
             return Response({'Bad Request': 'Invalid Room Code'}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'Bad Request': 'Invalid post data, did not find a code key'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -55,8 +98,8 @@ class CreateRoomView(APIView):  # Define a view for creating a Room
         
         serializer = self.serializer_class(data=request.data)  # Deserialize the request data
         if serializer.is_valid():  # Check if the data is valid
-            guest_can_pause = serializer.data.get('guest_can_pause')  # Get guest_can_pause from the data
-            votes_to_skip = serializer.data.get('votes_to_skip')  # Get votes_to_skip from the data
+            guest_can_pause = serializer.validated_data.get('guest_can_pause')  # Get guest_can_pause from the data
+            votes_to_skip = serializer.validated_data.get('votes_to_skip')  # Get votes_to_skip from the data
             host = self.request.session.session_key  # Get the session key as the host
             queryset = Room.objects.filter(host=host)  # Filter Room objects by host
             if queryset.exists():  # Check if a Room with the host already exists
@@ -65,37 +108,45 @@ class CreateRoomView(APIView):  # Define a view for creating a Room
                 room.votes_to_skip = votes_to_skip  # Update votes_to_skip
                 room.save(update_fields=['guest_can_pause', 'votes_to_skip'])  # Save the updates
                 self.request.session['room_code'] = room.code
-                return Response(RoomSerializer(room).data, status=status.HTTP_200_OK)  # Return the updated Room data
+                return self.membership_response(room_fields.instance(room), status.HTTP_200_OK)  # Return the updated Room data
             else:
                 room = Room(host=host, guest_can_pause=guest_can_pause, votes_to_skip=votes_to_skip)  # Create a new Room
                 room.save()  # Save the new Room
                 self.request.session['room_code'] = room.code
-                return Response(RoomSerializer(room).data, status=status.HTTP_201_CREATED)  # Return the new Room data
+                return self.membership_response(room_fields.instance(room), status.HTTP_201_CREATED)  # Return the new Room data
         return Response({'Bad Request': 'Invalid data...'}, status=status.HTTP_400_BAD_REQUEST)  # Return an error response if data is invalid
 
+    def membership_response(self, data, status_code):
+        """The host keeps its session (Spotify sign-in is tied to it) and also gets a token if enabled."""
+        response = Response(data, status=status_code)
+        if tokens_enabled():
+            set_token(response, data['code'], self.request.session.session_key)
+        return response
+
 
 class UserInRoom(APIView):
     def get(self, request, format=None):
-        if not self.request.session.exists(self.request.session.session_key):
+        if not tokens_enabled() and not self.request.session.exists(self.request.session.session_key):
             self.request.session.create()
 
         data = {
-            'code': self.request.session.get('room_code')
+            'code': get_room_code(request)
         }
         return JsonResponse(data, status=status.HTTP_200_OK)
 
 
 class LeaveRoom(APIView):
     def post(self, request, format=None):
-        if 'room_code' in self.request.session:
-            self.request.session.pop('room_code')
-            host_id = self.request.session.session_key
+        if get_room_code(request) is not None:
+            self.request.session.pop('room_code', None)
+            host_id = get_user_id(request)
             room_results = Room.objects.filter(host=host_id)
             if len(room_results) > 0:
                 room = room_results[0]
                 room.delete()
 
-        return Response({'Message': 'Success'}, status=status.HTTP_200_OK)
+        response = Response({'Message': 'Success'}, status=status.HTTP_200_OK)
+        return clear_token(response) if tokens_enabled() else response
 
 
 class UpdateRoom(APIView):
@@ -107,22 +158,22 @@ class UpdateRoom(APIView):
 
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid():
-            guest_can_pause = serializer.data.get('guest_can_pause')
-            votes_to_skip = serializer.data.get('votes_to_skip')
-            code = serializer.data.get('code')
+            guest_can_pause = serializer.validated_data.get('guest_can_pause')
+            votes_to_skip = serializer.validated_data.get('votes_to_skip')
+            code = serializer.validated_data.get('code')
 
             queryset = Room.objects.filter(code=code)
             if not queryset.exists():
                 return Response({'msg': 'Room not found.'}, status=status.HTTP_404_NOT_FOUND)
 
             room = queryset[0]
-            user_id = self.request.session.session_key
+            user_id = get_user_id(request)
             if room.host != user_id:
                 return Response({'msg': 'You are not the host of this room.'}, status=status.HTTP_403_FORBIDDEN)
 
             room.guest_can_pause = guest_can_pause
             room.votes_to_skip = votes_to_skip
             room.save(update_fields=['guest_can_pause', 'votes_to_skip'])
-            return Response(RoomSerializer(room).data, status=status.HTTP_200_OK)
+            return Response(room_fields.instance(room), status=status.HTTP_200_OK)
 
         return Response({'Bad Request': 'Invalid Data...'}, status=status.HTTP_400_BAD_REQUEST)
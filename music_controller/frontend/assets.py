@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+
+MANIFEST = 'frontend/manifest.json'
+FALLBACK = ['frontend/main.js']
+
+
+class AssetManifest:
+    """Script files per webpack entrypoint, read from the manifest the build writes.
+
+    The manifest is re-read whenever its modification time changes, so a rebuild
+    under ``npm run dev`` or a fresh ``collectstatic`` is picked up without a
+    restart. Its path is looked up once, and it is stat'ed on every call with
+    ``DEBUG`` on, otherwise at most every ``FRONTEND_MANIFEST_RECHECK_INTERVAL``
+    seconds. Without a manifest (a tree built before it existed) every
+    entrypoint falls back to the unhashed ``frontend/main.js``.
+    """
+
+    def __init__(self, name=MANIFEST, clock=time.monotonic):
+        self.name = name
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._loaded = (None, None, {})
+        self._checked = (None, None, None, None)  # STATIC_ROOT, path, mtime, checked at
+
+    def path(self):
+        root = getattr(settings, 'STATIC_ROOT', None)
+        if root:
+            candidate = os.path.join(root, self.name)
+            if os.path.exists(candidate):
+                return candidate
+        return finders.find(self.name)
+
+    def scripts(self, entrypoint='main'):
+        """Static paths of ``entrypoint``'s scripts, in the order they must load."""
+        entrypoints = self._entrypoints()
+        files = entrypoints.get(entrypoint)
+        if not files:
+            return list(FALLBACK)
+        return [f'frontend/{name}' for name in files]
+
+    def version(self):
+        """``(path, mtime)`` of the manifest in use; changes whenever a build rewrites it."""
+        root = getattr(settings, 'STATIC_ROOT', None)
+        now = self._clock()
+        checked_root, path, mtime, checked_at = self._checked
+        if checked_root == root and checked_at is not None and not settings.DEBUG \
+                and now - checked_at < getattr(settings, 'FRONTEND_MANIFEST_RECHECK_INTERVAL', 2.0):
+            return path, mtime
+        if checked_root != root or path is None:
+            path = self.path()
+        try:
+            mtime = os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            path, mtime = None, None  # Look it up again next time.
+        self._checked = (root, path, mtime, now)
+        return path, mtime
+
+    def _entrypoints(self):
+        path, mtime = self.version()
+        with self._lock:
+            if self._loaded[:2] == (path, mtime):
+                return self._loaded[2]
+        entrypoints = {}
+        if mtime is not None:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    entrypoints = json.load(f).get('entrypoints', {})
+            except (OSError, ValueError):
+                entrypoints = {}
+        with self._lock:
+            self._loaded = (path, mtime, entrypoints)
+        return entrypoints
+
+
+asset_manifest = AssetManifest()
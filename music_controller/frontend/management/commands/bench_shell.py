@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from frontend.shell import app_shell
+
+
+class Command(BaseCommand):
+    help = "Compare requests per second for the SPA shell rendered per request and served from memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=3.0, help="Seconds per mode.")
+        parser.add_argument('--path', default='/room/ABCDEF')
+        parser.add_argument('--accept-encoding', default='gzip, deflate, br')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            modes = (
+                ('rendered', False, False),
+                ('cached', True, False),
+                ('cached 304', True, True),
+            )
+            rows = [(label, *self.measure(cached, conditional, options)) for label, cached, conditional in modes]
+        finally:
+            teardown_test_environment()
+
+        self.stdout.write(f"GET {options['path']} with Accept-Encoding: {options['accept_encoding']}, {options['duration']:.0f}s per mode")
+        self.stdout.write(f"{'shell':<12}{'req/s':>10}{'mean us':>10}{'p99 us':>10}{'bytes':>8}  status")
+        for label, throughput, mean, p99, size, status in rows:
+            self.stdout.write(f"{label:<12}{throughput:>10.0f}{mean * 1e6:>10.0f}{p99 * 1e6:>10.0f}{size:>8}  {status}")
+
+    def measure(self, cached, conditional, options):
+        client = Client(HTTP_ACCEPT_ENCODING=options['accept_encoding'])
+        with override_settings(FRONTEND_SHELL_CACHE=cached):
+            app_shell.clear()
+            first = client.get(options['path'])
+            headers = {'HTTP_IF_NONE_MATCH': first['ETag']} if conditional else {}
+            latency = []
+            deadline = time.perf_counter() + options['duration']
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = client.get(options['path'], **headers)
+                latency.append(time.perf_counter() - started)
+        latency.sort()
+        elapsed = sum(latency)
+        return (
+            len(latency) / elapsed, elapsed / len(latency), latency[int(len(latency) * 0.99)],
+            len(response.content), response.status_code,
+        )
@@ -0,0 +1,67 @@
+import gzip
+import hashlib
+import threading
+
+from django.template.loader import render_to_string
+
+from .assets import asset_manifest
+
+try:
+    import brotli
+except ImportError:  # Optional: without it the shell is offered gzipped or plain.
+    brotli = None
+
+
+class RenderedShell:
+    """One rendering of the SPA shell, pre-encoded once per content coding."""
+
+    def __init__(self, html):
+        self.bodies = {'identity': html}
+        self.bodies['gzip'] = gzip.compress(html, compresslevel=9, mtime=0)
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(html, quality=11)
+        tag = hashlib.sha256(html).hexdigest()[:20]
+        self.etags = {
+            coding: f'"{tag}"' if coding == 'identity' else f'"{tag}-{coding}"' for coding in self.bodies
+        }
+
+    def choose(self, accepted):
+        """The smallest coding among ``accepted`` (plain when none is)."""
+        codings = [coding for coding in self.bodies if coding in accepted] or ['identity']
+        return min(codings, key=lambda coding: len(self.bodies[coding]))
+
+
+class AppShell:
+    """The index page every client-side route starts from, rendered once per frontend build.
+
+    The page has no per-request content: it only changes when the asset
+    manifest does, so :meth:`current` renders it on first use and again only
+    after a rebuild rewrites the manifest.
+    """
+
+    def __init__(self, template='frontend/index.html', manifest=asset_manifest):
+        self.template = template
+        self.manifest = manifest
+        self._lock = threading.Lock()
+        self._current = (None, None)
+        self.renders = 0
+
+    def current(self):
+        version = self.manifest.version()
+        rendered_version, rendered = self._current
+        if rendered is not None and rendered_version == version:
+            return rendered
+        with self._lock:
+            rendered_version, rendered = self._current
+            if rendered is None or rendered_version != version:
+                rendered = RenderedShell(render_to_string(self.template).encode())
+                self._current = (version, rendered)
+                self.renders += 1
+            return rendered
+
+    def clear(self):
+        with self._lock:
+            self._current = (None, None)
+
+
+app_shell = AppShell()
@@ -1,10 +1,12 @@
-import React, { useState, useEffect } from "react";
-import RoomJoinPage from "./RoomJoinPage";
-import CreateRoomPage from "./CreateRoomPage";
-import Room from "./Room";
+import React, { useState, useEffect, lazy, Suspense } from "react";
 import { Routes, Route, Link, useNavigate, useLocation, Navigate } from "react-router-dom";
 import { Box, Button, ButtonGroup, Typography } from "@mui/material";
-import Info from "./info";
+
+// Each page is its own chunk, fetched the first time its route renders.
+const RoomJoinPage = lazy(() => import(/* webpackChunkName: "join" */ "./RoomJoinPage"));
+const CreateRoomPage = lazy(() => import(/* webpackChunkName: "create" */ "./CreateRoomPage"));
+const Room = lazy(() => import(/* webpackChunkName: "room" */ "./Room"));
+const Info = lazy(() => import(/* webpackChunkName: "info" */ "./Info"));
 
 const HomePage = () => {
   const [roomCode, setRoomCode] = useState(null);
@@ -53,13 +55,15 @@ const HomePage = () => {
   );
 
   return (
-    <Routes>
-      <Route path="/" element={roomCode ? <Navigate to={`room/${roomCode}`} /> : renderHomePage()} />
-      <Route path="/join" element={<RoomJoinPage />} />
-      <Route path="/info" element={<Info />} />
-      <Route path="/create" element={<CreateRoomPage />} />
-      <Route path="/room/:roomCode" element={<Room leaveRoomCallback={leaveRoomCallback} />} />
-    </Routes>
+    <Suspense fallback={null}>
+      <Routes>
+        <Route path="/" element={roomCode ? <Navigate to={`room/${roomCode}`} /> : renderHomePage()} />
+        <Route path="/join" element={<RoomJoinPage />} />
+        <Route path="/info" element={<Info />} />
+        <Route path="/create" element={<CreateRoomPage />} />
+        <Route path="/room/:roomCode" element={<Room leaveRoomCallback={leaveRoomCallback} />} />
+      </Routes>
+    </Suspense>
   );
 };
 
@@ -1,4 +1,4 @@
-import React, { useState } from "react";
+import React, { useEffect, useState } from "react";
 import PropTypes from "prop-types";
 import {
   Box,
@@ -22,12 +22,23 @@ const MusicPlayer = ({
   is_playing,
   time,
   duration,
+  received_at,
   votes,
   votes_required,
   onPlayPause,
   onSkip,
 }) => {
-  const songProgress = (time / duration) * 100;
+  // Progress is `time` as of `received_at`, advanced locally while playing instead of refetched.
+  const [now, setNow] = useState(Date.now());
+  useEffect(() => {
+    setNow(Date.now());
+    if (!is_playing) return undefined;
+    const ticker = setInterval(() => setNow(Date.now()), 1000);
+    return () => clearInterval(ticker);
+  }, [is_playing, received_at]);
+  const elapsed = is_playing && received_at ? Math.max(0, now - received_at) : 0;
+  const position = Math.min(time + elapsed, duration);
+  const songProgress = duration ? (position / duration) * 100 : 0;
   const [message, setMessage] = useState("");
   const [messageType, setMessageType] = useState("info");
   const [open, setOpen] = useState(false);
@@ -159,6 +170,7 @@ MusicPlayer.propTypes = {
   is_playing: PropTypes.bool.isRequired,
   time: PropTypes.number.isRequired,
   duration: PropTypes.number.isRequired,
+  received_at: PropTypes.number,
   votes: PropTypes.number.isRequired,
   votes_required: PropTypes.number.isRequired,
   onPlayPause: PropTypes.func,
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { useParams, useNavigate } from "react-router-dom";
 import { Box, Button, Typography } from "@mui/material";
 import CreateRoomPage from "./CreateRoomPage";
@@ -51,21 +51,43 @@ const Room = ({ leaveRoomCallback }) => {
     }
   };
 
-  // Fetch current song
-  const getCurrentSong = async () => {
+  // Newer playback state replaces older; `received_at` is the local clock the player advances progress from.
+  const songRef = useRef({});
+  const applySong = (data) => {
+    if (songRef.current.version > data.version) {
+      return;  // An out-of-order response or a replayed event
+    }
+    songRef.current = { ...data, received_at: Date.now() };
+    setSong(songRef.current);
+  };
+
+  // Fetch current song, revalidating against the last ETag so unchanged polls are a bodiless 304.
+  // With `wait`, the server holds the request for up to that many seconds until the song changes.
+  const songETag = useRef(null);
+  const getCurrentSong = async (wait) => {
     try {
-      const response = await fetch("/spotify/current-song");
+      const since = songETag.current || "";
+      const url = wait
+        ? `/spotify/current-song?wait=${wait}&since=${encodeURIComponent(since)}`
+        : "/spotify/current-song";
+      const headers = songETag.current ? { "If-None-Match": songETag.current } : {};
+      const response = await fetch(url, { cache: "no-store", headers });
+
+      if (response.status === 304) {
+        return true;  // Unchanged; the player keeps the bar moving
+      }
   
       if (response.status === 204) {
+        songETag.current = response.headers.get("ETag");
         console.log("No song is currently playing.");
-        return;  // Exit early if no content is returned
+        return true;  // Exit early if no content is returned
       }
       
       if (response.status === 401) {
         console.error("User is not authenticated. Redirecting to Spotify login.");
         // Redirect user to Spotify authentication if needed
         window.location.href = "/spotify/get-auth-url";
-        return;
+        return false;
       }
       
       if (!response.ok) {
@@ -73,18 +95,51 @@ const Room = ({ leaveRoomCallback }) => {
       }
   
       const data = await response.json();
-      setSong(data);
-      console.log("Current song data:", data);
+      songETag.current = response.headers.get("ETag");
+      applySong(data);
+      return true;
     } catch (error) {
       console.error("Failed to fetch current song:", error);
+      return false;
     }
   };
-  
+
+  // Subscribe to playback changes, falling back to long polling without EventSource.
+  // Long polls start no more often than the server's `next_poll_ms` hint; a change that
+  // lands in between is answered at once by the next one, since it carries the old ETag.
+  const subscribeToCurrentSong = () => {
+    if (typeof EventSource === "undefined") {
+      let active = true;
+      (async () => {
+        while (active) {
+          const started = Date.now();
+          const spacing = (await getCurrentSong(30)) ? songRef.current.next_poll_ms || 0 : 1000;  // Back off after errors
+          const rest = spacing - (Date.now() - started);
+          if (active && rest > 0) {
+            await new Promise((resolve) => setTimeout(resolve, rest));
+          }
+        }
+      })();
+      return () => {
+        active = false;
+      };
+    }
+
+    const source = new EventSource("/spotify/current-song/stream");
+    source.addEventListener("song", (event) => applySong(JSON.parse(event.data)));
+    source.addEventListener("idle", () => console.log("No song is currently playing."));
+    source.addEventListener("closed", () => {
+      source.close();
+      leaveRoomCallback();
+      navigate("/");
+    });
+    return () => source.close();
+  };
 
   useEffect(() => {
     getRoomDetails();
-    const songInterval = setInterval(getCurrentSong, 1000);
-    return () => clearInterval(songInterval); // Cleanup interval on component unmount
+    const unsubscribe = subscribeToCurrentSong();
+    return unsubscribe; // Cleanup subscription on component unmount
   }, [roomCode, navigate, leaveRoomCallback]);
 
   // Leave room
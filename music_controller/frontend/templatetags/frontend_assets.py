@@ -0,0 +1,16 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from frontend.assets import asset_manifest
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def frontend_scripts(entrypoint='main'):
+    """``<script defer>`` tags for every file of a webpack entrypoint, runtime first."""
+    return format_html_join('\n    ', '<script defer src="{}"></script>', (
+        (static(path),) for path in asset_manifest.scripts(entrypoint)
+    ))
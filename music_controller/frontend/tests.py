@@ -1,3 +1,158 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils.http import http_date
+
+from .assets import AssetManifest, asset_manifest
+from .shell import app_shell
+from .views import accepted_encodings
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.root = tmpdir.name
+        os.makedirs(os.path.join(self.root, 'frontend'))
+        settings = override_settings(STATIC_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, 'frontend', name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    @override_settings(FRONTEND_MANIFEST_RECHECK_INTERVAL=0)
+    def test_index_loads_the_manifest_entrypoint_in_order(self):
+        self.write('manifest.json', json.dumps(
+            {'entrypoints': {'main': ['runtime.0123abcd.js', 'main.89abcdef.js']}}
+        ).encode())
+        html = self.client.get('/').content.decode()
+        self.assertLess(
+            html.index('<script defer src="/static/frontend/runtime.0123abcd.js">'),
+            html.index('<script defer src="/static/frontend/main.89abcdef.js">'),
+        )
+
+        # A rebuild is picked up without a restart.
+        path = self.write('manifest.json', json.dumps({'entrypoints': {'main': ['main.fedcba98.js']}}).encode())
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+        self.assertIn('/static/frontend/main.fedcba98.js', self.client.get('/').content.decode())
+
+    def test_manifest_is_only_rechecked_after_the_interval(self):
+        self.write('manifest.json', json.dumps({'entrypoints': {'main': ['main.89abcdef.js']}}).encode())
+        now = [0.0]
+        manifest = AssetManifest(clock=lambda: now[0])
+        version = manifest.version()
+        with mock.patch('frontend.assets.finders.find') as find, mock.patch('frontend.assets.os.stat') as stat:
+            self.assertEqual(manifest.version(), version)
+            find.assert_not_called()
+            stat.assert_not_called()
+            with override_settings(DEBUG=True):
+                manifest.version()
+            self.assertEqual(stat.call_count, 1)
+        now[0] = 10.0
+        with mock.patch('frontend.assets.finders.find') as find:
+            self.assertEqual(manifest.version()[0], version[0])
+            find.assert_not_called()
+
+    def test_index_falls_back_to_the_unhashed_bundle(self):
+        self.assertEqual(asset_manifest.scripts(), ['frontend/main.js'])
+        self.assertIn('<script defer src="/static/frontend/main.js">', self.client.get('/').content.decode())
+
+    def test_hashed_bundle_is_precompressed_and_immutable(self):
+        self.write('main.89abcdef.js', b'console.log("plain")')
+        self.write('main.89abcdef.js.gz', b'gzip bytes')
+        self.write('main.89abcdef.js.br', b'brotli bytes')
+
+        response = self.client.get('/static/frontend/main.89abcdef.js', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(b''.join(response.streaming_content), b'brotli bytes')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertTrue(response['Content-Type'].startswith('text/javascript'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertNotIn('Content-Disposition', response)
+
+        response = self.client.get('/static/frontend/main.89abcdef.js', HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(b''.join(response.streaming_content), b'gzip bytes')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        response = self.client.get('/static/frontend/main.89abcdef.js')
+        self.assertEqual(b''.join(response.streaming_content), b'console.log("plain")')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_unhashed_files_revalidate(self):
+        path = self.write('main.js', b'console.log("dev")')
+        response = self.client.get('/static/frontend/main.js')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(response['Last-Modified'], http_date(os.stat(path).st_mtime))
+
+        response = self.client.get('/static/frontend/main.js', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_and_traversing_paths_are_404(self):
+        self.assertEqual(self.client.get('/static/frontend/nope.js').status_code, 404)
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/static/frontend/%2e%2e/%2e%2e/settings.py').status_code, 404)
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('gzip;q=1.0, br;q=0, identity'), {'gzip', 'identity'})
+        self.assertEqual(accepted_encodings(''), set())
+
+
+class AppShellTests(TestCase):
+    def setUp(self):
+        app_shell.clear()
+        self.addCleanup(app_shell.clear)
+
+    def test_shell_is_rendered_once_and_served_pre_encoded(self):
+        renders = app_shell.renders
+        plain = self.client.get('/join')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn(b'<div id="app"></div>', plain.content)
+
+        with self.assertTemplateNotUsed('frontend/index.html'):
+            zipped = self.client.get('/room/ABCDEF', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(zipped.content), plain.content)
+        self.assertEqual(zipped['Vary'], 'Accept-Encoding')
+        self.assertNotEqual(zipped['ETag'], plain['ETag'])
+        self.assertEqual(app_shell.renders, renders + 1)
+
+        refused = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', refused)
+
+    def test_conditional_get(self):
+        etag = self.client.get('/', HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        response = self.client.get('/create', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        weak = self.client.get('/', HTTP_IF_NONE_MATCH=f'W/{etag}, "other"')
+        self.assertEqual(weak.status_code, 304)
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    @override_settings(FRONTEND_MANIFEST_RECHECK_INTERVAL=0)
+    def test_rebuild_renders_again(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        os.makedirs(os.path.join(tmpdir.name, 'frontend'))
+        with override_settings(STATIC_ROOT=tmpdir.name):
+            before = self.client.get('/')['ETag']
+            with open(os.path.join(tmpdir.name, 'frontend', 'manifest.json'), 'w') as f:
+                json.dump({'entrypoints': {'main': ['main.89abcdef.js']}}, f)
+            response = self.client.get('/')
+        self.assertNotEqual(response['ETag'], before)
+        self.assertIn(b'/static/frontend/main.89abcdef.js', response.content)
+
+    @override_settings(FRONTEND_SHELL_CACHE=False)
+    def test_cache_can_be_turned_off(self):
+        with self.assertTemplateUsed('frontend/index.html'):
+            response = self.client.get('/')
+        self.assertNotIn('ETag', response)
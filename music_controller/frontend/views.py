@@ -1,5 +1,113 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from .shell import app_shell
+
+
+# webpack's [contenthash:8]: the name changes whenever the content does.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
 
 # Create your views here.
 def index(request, *args, **kwargs):
-    return render(request, 'frontend/index.html')
+    """The SPA shell, from memory: pre-encoded, with an ETag per coding and conditional GET."""
+    if not getattr(settings, 'FRONTEND_SHELL_CACHE', True):
+        return render(request, 'frontend/index.html')
+
+    shell = app_shell.current()
+    coding = shell.choose(accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+    if_none_match = {etag.removeprefix('W/') for etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))}
+    if '*' in if_none_match or any(etag in if_none_match for etag in shell.etags.values()):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(shell.bodies[coding], content_type='text/html; charset=utf-8')
+        if coding != 'identity':
+            response['Content-Encoding'] = coding
+    response['ETag'] = shell.etags[coding]
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+def accepted_encodings(header):
+    """Codings the client accepts from an ``Accept-Encoding`` header (``q=0`` refuses one)."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def find_static(path):
+    """Absolute path of static file ``path`` in STATIC_ROOT or, failing that, the app static dirs."""
+    root = getattr(settings, 'STATIC_ROOT', None)
+    if root:
+        try:
+            candidate = safe_join(root, path)
+        except SuspiciousFileOperation:
+            return None
+        if os.path.isfile(candidate):
+            return candidate
+    try:
+        return finders.find(path)
+    except SuspiciousFileOperation:
+        return None
+
+
+def serve_static(request, path):
+    """Serve a static file, preferring a precompressed ``.br``/``.gz`` sibling the client accepts.
+
+    Content-hashed names are cached for a year as immutable; everything else is
+    revalidated on each use through ``Last-Modified``.
+    """
+    original = find_static(path)
+    if original is None:
+        raise Http404(path)
+
+    chosen, encoding = original, None
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    for coding, suffix in ENCODINGS:
+        if coding in accepted and os.path.isfile(original + suffix):
+            chosen, encoding = original + suffix, coding
+            break
+
+    stat = os.stat(original)
+    immutable = bool(HASHED_NAME.search(os.path.basename(path)))
+    if not immutable:
+        since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if since is not None and int(stat.st_mtime) <= since:
+            response = HttpResponseNotModified()
+            response['Vary'] = 'Accept-Encoding'
+            return response
+
+    content_type, _ = mimetypes.guess_type(original)
+    response = FileResponse(open(chosen, 'rb'), content_type=content_type or 'application/octet-stream')
+    if 'Content-Disposition' in response:
+        del response['Content-Disposition']
+    response['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if immutable:
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'no-cache'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -1,31 +1,91 @@
 const path = require('path');
-const webpack = require('webpack');
+const zlib = require('zlib');
+const { Compilation, sources } = require('webpack');
 
-module.exports = {
-    entry: './src/index.js',
-    output: {
-        path: path.resolve(__dirname, 'static/frontend'),
-        filename: '[name].js',
-    },
-    module: {
-        rules: [
-            {
-                test: /\.(js|jsx)$/,
-                exclude: /node_modules/,
-                use: {
-                    loader: 'babel-loader',
+// Writes manifest.json listing each entrypoint's files in load order; Django's
+// {% frontend_scripts %} tag reads it to emit the (hashed) script tags.
+class AssetManifestPlugin {
+    apply(compiler) {
+        compiler.hooks.thisCompilation.tap('AssetManifestPlugin', (compilation) => {
+            compilation.hooks.processAssets.tap(
+                { name: 'AssetManifestPlugin', stage: Compilation.PROCESS_ASSETS_STAGE_REPORT },
+                () => {
+                    const entrypoints = {};
+                    for (const [name, entrypoint] of compilation.entrypoints) {
+                        entrypoints[name] = entrypoint.getFiles().filter((file) => file.endsWith('.js'));
+                    }
+                    compilation.emitAsset('manifest.json', new sources.RawSource(JSON.stringify({ entrypoints }, null, 2)));
                 },
-            },
+            );
+        });
+    }
+}
+
+// Emits .gz and .br siblings of every text asset over `threshold` bytes, so the
+// server never compresses on the fly.
+class PrecompressPlugin {
+    constructor({ test = /\.(js|css|html|svg|txt)$/, threshold = 1024 } = {}) {
+        this.test = test;
+        this.threshold = threshold;
+    }
+
+    apply(compiler) {
+        compiler.hooks.thisCompilation.tap('PrecompressPlugin', (compilation) => {
+            compilation.hooks.processAssets.tap(
+                { name: 'PrecompressPlugin', stage: Compilation.PROCESS_ASSETS_STAGE_OPTIMIZE_TRANSFER },
+                (assets) => {
+                    for (const name of Object.keys(assets)) {
+                        if (!this.test.test(name)) {
+                            continue;
+                        }
+                        const source = compilation.getAsset(name).source.buffer();
+                        if (source.length < this.threshold) {
+                            continue;
+                        }
+                        compilation.emitAsset(`${name}.gz`, new sources.RawSource(zlib.gzipSync(source, { level: 9 })));
+                        compilation.emitAsset(`${name}.br`, new sources.RawSource(zlib.brotliCompressSync(source, {
+                            params: { [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY },
+                        })));
+                    }
+                },
+            );
+        });
+    }
+}
+
+module.exports = (env, argv) => {
+    const production = argv.mode === 'production';
+    const filename = production ? '[name].[contenthash:8].js' : '[name].js';
+
+    return {
+        entry: { main: './src/index.js' },
+        output: {
+            path: path.resolve(__dirname, 'static/frontend'),
+            publicPath: 'auto',
+            filename,
+            chunkFilename: filename,
+            clean: true,
+        },
+        module: {
+            rules: [
+                {
+                    test: /\.(js|jsx)$/,
+                    exclude: /node_modules/,
+                    use: {
+                        loader: 'babel-loader',
+                    },
+                },
+            ],
+        },
+        optimization: {
+            minimize: production,
+            moduleIds: 'deterministic',
+            runtimeChunk: 'single',
+            splitChunks: { chunks: 'all' },
+        },
+        plugins: [
+            new AssetManifestPlugin(),
+            ...(production ? [new PrecompressPlugin()] : []),
         ],
-    },
-    optimization: {
-        minimize: true,
-    },
-    plugins: [
-        new webpack.DefinePlugin({
-            'process.env': {
-                NODE_ENV: JSON.stringify('development'),
-            },
-        }),
-    ],
-};
\ No newline at end of file
+    };
+};
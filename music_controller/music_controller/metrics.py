@@ -0,0 +1,238 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+``MetricsMiddleware`` records per-route request latency together with the time
+each request spent in the database and in upstream Spotify calls, so the share
+of a route's latency owed to each can be read off the ``_sum`` series.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            counts, total = self._values.get(labelvalues, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[labelvalues] = (counts, total + value)
+
+    def count(self, *labelvalues):
+        with self._lock:
+            counts, _ = self._values.get(labelvalues, ([0], 0.0))
+            return counts[-1]
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labelvalues, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    labels = _labels(self.labelnames, labelvalues, [('le', _number(bound))])
+                    lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _labels(self.labelnames, labelvalues)
+                lines.append(f'{self.name}_sum{labels} {_number(total)}')
+                lines.append(f'{self.name}_count{labels} {counts[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """Register ``collect()`` returning ``(name, type, help, value)`` tuples read at scrape time."""
+        self._collectors.append(collect)
+
+    def expose(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        for collect in self._collectors:
+            for name, kind, help, value in collect():
+                lines.extend([f'# HELP {name} {help}', f'# TYPE {name} {kind}', f'{name} {_number(value)}'])
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route.', ['route', 'method']))
+requests_total = registry.register(Counter(
+    'http_requests_total', 'Responses by route and status code.', ['route', 'method', 'status']))
+request_db_queries = registry.register(Histogram(
+    'http_request_db_queries', 'ORM queries issued per request.', ['route'], buckets=COUNT_BUCKETS))
+request_db_duration = registry.register(Histogram(
+    'http_request_db_seconds', 'Time per request spent executing ORM queries.', ['route']))
+request_upstream_duration = registry.register(Histogram(
+    'http_request_upstream_seconds', 'Time per request spent waiting on Spotify.', ['route']))
+upstream_duration = registry.register(Histogram(
+    'spotify_request_duration_seconds', 'Duration of Spotify API calls, by endpoint and status.', ['endpoint', 'status']))
+background_db_queries = registry.register(Counter(
+    'background_db_queries_total', 'ORM queries issued outside any request (pollers, refreshers).'))
+
+
+class _RequestTimings:
+    __slots__ = ('queries', 'db_seconds', 'upstream_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.upstream_seconds = 0.0
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings = _current.get()
+        if timings is None:
+            background_db_queries.inc()
+        else:
+            timings.queries += 1
+            timings.db_seconds += time.perf_counter() - start
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(_instrument_connection)
+
+
+@contextmanager
+def time_upstream(endpoint):
+    """Time a Spotify call; the body sets ``call.status`` from the response."""
+    call = _UpstreamCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        elapsed = time.perf_counter() - start
+        upstream_duration.observe(elapsed, endpoint, call.status)
+        timings = _current.get()
+        if timings is not None:
+            timings.upstream_seconds += elapsed
+
+
+class _UpstreamCall:
+    __slots__ = ('status',)
+
+    def __init__(self):
+        self.status = 'error'
+
+
+class MetricsMiddleware:
+    """Record latency, DB and upstream time for every request."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token, start = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, timings, start)
+        return response
+
+    async def __acall__(self, request):
+        timings, token, start = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, timings, start)
+        return response
+
+    def _start(self):
+        timings = _RequestTimings()
+        return timings, _current.set(timings), time.perf_counter()
+
+    def _finish(self, request, response, timings, start):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        request_duration.observe(time.perf_counter() - start, route, request.method)
+        requests_total.inc(route, request.method, str(response.status_code))
+        request_db_queries.observe(timings.queries, route)
+        request_db_duration.observe(timings.db_seconds, route)
+        request_upstream_duration.observe(timings.upstream_seconds, route)
+
+
+def metrics_view(request):
+    return HttpResponse(registry.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
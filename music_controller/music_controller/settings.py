@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'music_controller.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,6 +75,16 @@ TEMPLATES = [
 WSGI_APPLICATION = 'music_controller.wsgi.application'
 
 
+# JSON responses are rendered with orjson when it is installed (same output as DRF's JSONRenderer);
+# without it FastJSONRenderer falls back to the standard json module.
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
@@ -121,7 +132,118 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Serve STATIC_URL from Django, picking the .br/.gz files `npm run build` writes next to each
+# bundle and marking content-hashed bundles immutable. Turn off when a CDN or nginx serves it.
+FRONTEND_SERVE_STATIC = True
+
+# Serve the SPA shell (/, /join, /create, /room/<code>) from a copy rendered once per frontend
+# build and pre-encoded with gzip (and brotli when the `brotli` package is installed).
+FRONTEND_SHELL_CACHE = True
+
+# Seconds between checks of the frontend build manifest for a rebuild; with DEBUG on, every request.
+FRONTEND_MANIFEST_RECHECK_INTERVAL = 2.0
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Room codes
+
+# Key for the permutation that turns the room code sequence into codes (defaults to SECRET_KEY).
+# Changing it is safe: codes already in use are skipped.
+ROOM_CODE_KEY = None
+ROOM_CODE_BLOCK_SIZE = 64
+
+# Seconds a room row and its vote tallies are shared between polls (writes in this process invalidate at once).
+ROOM_CACHE_TTL = 1.0
+
+# Carry room membership in a signed cookie / X-Room-Token header instead of the session, so polls,
+# votes and playback commands never read the session table. Spotify sign-in still uses the session.
+ROOM_MEMBERSHIP_TOKENS = False
+ROOM_MEMBERSHIP_TOKEN_MAX_AGE = 60 * 60 * 24 * 14
+
+# Room.last_activity is written at most once per interval per room while members poll (seconds).
+ROOM_ACTIVITY_WRITE_INTERVAL = 60.0
+
+# Rooms idle this long are deleted by `manage.py reap_rooms`, together with stale votes, orphaned
+# Spotify tokens and expired sessions, in short batched transactions. Set ROOM_REAPER_IN_BACKGROUND
+# to run the same pass from a background thread every ROOM_REAPER_INTERVAL seconds instead of cron.
+ROOM_IDLE_TIMEOUT = 60 * 60 * 12
+ROOM_REAPER_IN_BACKGROUND = False
+ROOM_REAPER_INTERVAL = 600
+ROOM_REAPER_BATCH_SIZE = 100
+ROOM_REAPER_BATCH_PAUSE = 0.05
+
+
+# Spotify
+
+# Seconds a room's now-playing payload is shared between listeners before refetching.
+SPOTIFY_NOW_PLAYING_TTL = 1.0
+
+# Poll Spotify from a background task per active room instead of inside CurrentSong requests.
+# Polls are timed to the end of the current track, bounded by these intervals (seconds).
+SPOTIFY_BACKGROUND_POLLING = True
+SPOTIFY_POLL_MIN_INTERVAL = 1.0
+SPOTIFY_POLL_MAX_INTERVAL = 5.0
+SPOTIFY_POLL_IDLE_TIMEOUT = 30.0
+SPOTIFY_POLL_WORKERS = 4
+# With a shared state store, the worker that polls a room holds it for this long after each poll (seconds).
+SPOTIFY_POLL_LEASE_TTL = 15.0
+
+# Most room codes one /spotify/room-states request may ask about.
+ROOM_STATES_MAX_CODES = 100
+
+# Longest a /spotify/current-song?wait=... long poll is held open (seconds).
+SPOTIFY_LONG_POLL_MAX_WAIT = 60.0
+
+# Bounds for the `next_poll_ms` hint in current-song payloads (seconds). Clients advance progress
+# themselves, so a playing track is re-read when it ends; rooms that changed within the active
+# window or have skip votes pending are re-read more often. Keep the maximum below
+# SPOTIFY_POLL_IDLE_TIMEOUT so hinted clients keep their room's poller alive.
+SPOTIFY_CLIENT_POLL_MIN_INTERVAL = 1.0
+SPOTIFY_CLIENT_POLL_ACTIVE_INTERVAL = 3.0
+SPOTIFY_CLIENT_POLL_MAX_INTERVAL = 15.0
+SPOTIFY_CLIENT_ACTIVE_WINDOW = 30.0
+
+# Queue play/pause/skip per room (views answer 202 with a command id) so bursts of contradictory
+# commands are collapsed before reaching Spotify; False sends each command inside its request.
+SPOTIFY_COMMAND_QUEUE = True
+SPOTIFY_COMMAND_WORKERS = 4
+
+SPOTIFY_API_URL = 'https://api.spotify.com/v1/me/'
+SPOTIFY_ACCOUNTS_URL = 'https://accounts.spotify.com/'
+
+# Upstream calls share a keep-alive pool and never wait longer than these timeouts (seconds).
+SPOTIFY_CONNECT_TIMEOUT = 3.05
+SPOTIFY_READ_TIMEOUT = 10.0
+SPOTIFY_POOL_SIZE = 20
+
+# Upstream token buckets (calls per second and burst), globally and per host. Background
+# polls leave COMMAND_RESERVE tokens for play/pause/skip; a 429 pauses calls for its Retry-After.
+SPOTIFY_RATE_LIMIT_GLOBAL_RATE = 10.0
+SPOTIFY_RATE_LIMIT_GLOBAL_BURST = 20
+SPOTIFY_RATE_LIMIT_HOST_RATE = 2.0
+SPOTIFY_RATE_LIMIT_HOST_BURST = 5
+SPOTIFY_RATE_LIMIT_COMMAND_RESERVE = 2
+
+# Host tokens kept in memory per process; tokens this close to expiry (seconds) are re-read.
+SPOTIFY_TOKEN_CACHE_SIZE = 256
+SPOTIFY_TOKEN_CACHE_EXPIRY_MARGIN = 60
+
+# Renew host tokens this many seconds before they expire, checking every interval, in batches.
+# A host whose refresh keeps failing (e.g. a revoked grant) is retried after the interval,
+# doubling up to the max backoff (seconds).
+SPOTIFY_TOKEN_REFRESH_IN_BACKGROUND = True
+SPOTIFY_TOKEN_REFRESH_MARGIN = 300
+SPOTIFY_TOKEN_REFRESH_INTERVAL = 60
+SPOTIFY_TOKEN_REFRESH_BATCH_SIZE = 50
+SPOTIFY_TOKEN_REFRESH_MAX_BACKOFF = 3600
+
+# Share now-playing state, room changes and token invalidations between the worker processes of
+# one host, so one worker polls each room. LocalStateStore shares nothing (one process); e.g.
+#   SHARED_STATE_BACKEND = 'music_controller.shared_state.SQLiteStateStore'
+#   SHARED_STATE_OPTIONS = {'path': BASE_DIR / 'shared_state.sqlite3', 'interval': 0.02}
+SHARED_STATE_BACKEND = 'music_controller.shared_state.LocalStateStore'
+SHARED_STATE_OPTIONS = {}
@@ -0,0 +1,183 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class LocalStateStore:
+    """The default store, for a single worker process: there is nobody to share with.
+
+    Writes are dropped, reads find nothing and every lease is granted, so callers
+    behave exactly as if no store were configured.
+    """
+
+    def subscribe(self, kind, callback):
+        pass
+
+    def ensure_started(self):
+        pass
+
+    def put(self, kind, key, value=None):
+        pass
+
+    def get(self, kind, key):
+        return None
+
+    def claim(self, name, ttl):
+        return True
+
+    def stop(self):
+        pass
+
+
+class SQLiteStateStore:
+    """Shares small JSON values between the worker processes of one host through a SQLite file in WAL mode.
+
+    Each ``(kind, key)`` holds its latest value and a version taken from a counter
+    shared by all keys. Every process runs a watcher thread that checks
+    ``PRAGMA data_version`` every ``interval`` seconds and, when another process
+    has committed, hands each newer row written by another process to
+    ``callback(key, value)`` for every subscriber of its kind. Leases name one
+    process at a time, e.g. the one that polls a room.
+    """
+
+    def __init__(self, path, interval=0.02, timeout=5.0):
+        self.path = path
+        self.interval = interval
+        self.timeout = timeout
+        self.origin = uuid.uuid4().hex
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._subscribers = defaultdict(list)
+        self._setup()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    @property
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def _setup(self):
+        connection = self._connect()
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS state (
+                    kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT, origin TEXT NOT NULL,
+                    version INTEGER NOT NULL, PRIMARY KEY (kind, key)
+                );
+                CREATE INDEX IF NOT EXISTS state_version ON state (version);
+                CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL);
+            ''')
+        finally:
+            connection.close()
+
+    def subscribe(self, kind, callback):
+        """Call ``callback(key, value)`` whenever another process puts a value of ``kind``."""
+        with self._lock:
+            self._subscribers[kind].append(callback)
+
+    def ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._watch, name='shared-state', daemon=True)
+                    self._thread.start()
+
+    def put(self, kind, key, value=None):
+        """Store ``value`` (anything JSON can encode, or None for a bare change event) under ``(kind, key)``."""
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT INTO state (kind, key, value, origin, version) '
+                'VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(version), 0) + 1 FROM state)) '
+                'ON CONFLICT (kind, key) DO UPDATE SET '
+                'value = excluded.value, origin = excluded.origin, version = excluded.version',
+                (kind, key, json.dumps(value), self.origin),
+            )
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def get(self, kind, key):
+        row = self._connection.execute('SELECT value FROM state WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def claim(self, name, ttl):
+        """Take or renew lease ``name`` for ``ttl`` seconds; False while another process holds it."""
+        now = time.time()
+        cursor = self._connection.execute(
+            'INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires '
+            'WHERE leases.owner = excluded.owner OR leases.expires < ?',
+            (name, self.origin, now + ttl, now),
+        )
+        return cursor.rowcount == 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        connection = self._connect()
+        try:
+            seen = connection.execute('SELECT COALESCE(MAX(version), 0) FROM state').fetchone()[0]
+            data_version = None
+            while not self._stop.wait(self.interval):
+                try:
+                    current = connection.execute('PRAGMA data_version').fetchone()[0]
+                    if current == data_version:
+                        continue
+                    data_version = current
+                    rows = connection.execute(
+                        'SELECT kind, key, value, origin, version FROM state WHERE version > ? ORDER BY version', (seen,)
+                    ).fetchall()
+                except sqlite3.Error:
+                    logger.exception("Reading shared state from %s failed", self.path)
+                    continue
+                for kind, key, value, origin, version in rows:
+                    seen = version
+                    if origin != self.origin:
+                        self._deliver(kind, key, json.loads(value))
+        finally:
+            connection.close()
+
+    def _deliver(self, kind, key, value):
+        with self._lock:
+            callbacks = list(self._subscribers.get(kind, ()))
+        for callback in callbacks:
+            try:
+                callback(key, value)
+            except Exception:
+                logger.exception("Shared %s update for %s failed", kind, key)
+
+
+def load_store():
+    """Build the store named by ``SHARED_STATE_BACKEND`` with ``SHARED_STATE_OPTIONS``."""
+    backend = import_string(getattr(settings, 'SHARED_STATE_BACKEND', 'music_controller.shared_state.LocalStateStore'))
+    return backend(**getattr(settings, 'SHARED_STATE_OPTIONS', {}))
+
+
+shared_state = load_store()
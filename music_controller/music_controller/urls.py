@@ -14,12 +14,21 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+from frontend.views import serve_static
+from .metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view),
     path('api/', include('api.urls')),
     path('', include('frontend.urls', namespace='frontend')),
     path('spotify/', include('spotify.urls')),
 ]
+
+# Serve the built frontend with its precompressed variants and long-lived caching
+# headers, unless a CDN or the front web server serves STATIC_URL itself.
+if getattr(settings, 'FRONTEND_SERVE_STATIC', True) and '://' not in settings.STATIC_URL:
+    urlpatterns.insert(0, re_path(rf'^{settings.STATIC_URL.strip("/")}/(?P<path>.+)$', serve_static))
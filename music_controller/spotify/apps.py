@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class SpotifyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'spotify'
+
+    def ready(self):
+        from music_controller.metrics import registry
+        from . import signals  # noqa: F401
+        from .metrics import collect
+
+        registry.register_collector(collect)
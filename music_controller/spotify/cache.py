@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class _Entry:
+    """A cached upstream payload and the monotonic time it was fetched."""
+    __slots__ = ('payload', 'fetched_at')
+
+    def __init__(self, payload, fetched_at):
+        self.payload = payload
+        self.fetched_at = fetched_at
+
+
+class _Flight:
+    """An upstream fetch in progress that other callers can wait on."""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def outcome(self):
+        if self.error is not None:
+            raise self.error
+        return dict(self.result)
+
+
+class NowPlayingCache:
+    """Per-room cache of the host's currently-playing payload.
+
+    Entries live for ``ttl`` seconds. Concurrent misses for the same room share a
+    single upstream fetch, and ``progress_ms`` is advanced locally between fetches.
+    """
+
+    def __init__(self, ttl=1.0, max_entries=1024, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, room_code, fetch):
+        """Return the payload for ``room_code``, calling ``fetch()`` at most once per TTL."""
+        with self._lock:
+            payload, flight, leader = self._lookup(room_code)
+        if payload is not None:
+            return payload
+        if not leader:
+            flight.done.wait()
+            return flight.outcome()
+        try:
+            payload = fetch()
+        except BaseException as e:
+            # Waiters must not read a missing result, even when the leader is interrupted.
+            flight.error = e
+            raise
+        else:
+            self._land(room_code, flight, payload)
+        finally:
+            self._finish(room_code, flight)
+        return dict(payload)
+
+    def _lookup(self, room_code):
+        """``(payload, None, False)`` on a hit, else the flight to join or lead; call with the lock held."""
+        now = self._clock()
+        entry = self._entries.get(room_code)
+        if entry is not None and now - entry.fetched_at < self.ttl:
+            self.hits += 1
+            return self._extrapolate(entry.payload, now - entry.fetched_at), None, False
+
+        flight = self._inflight.get(room_code)
+        leader = flight is None
+        if leader:
+            flight = self._inflight[room_code] = _Flight()
+            self.misses += 1
+        else:
+            self.coalesced += 1
+        return None, flight, leader
+
+    def _land(self, room_code, flight, payload):
+        flight.result = payload
+        with self._lock:
+            self._entries[room_code] = _Entry(payload, self._clock())
+            self._prune()
+
+    def _finish(self, room_code, flight):
+        with self._lock:
+            self._inflight.pop(room_code, None)
+        flight.done.set()
+
+    def peek(self, room_code):
+        """Return the last published payload for ``room_code`` regardless of age, or None."""
+        with self._lock:
+            entry = self._entries.get(room_code)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._extrapolate(entry.payload, self._clock() - entry.fetched_at)
+
+    def publish(self, room_code, payload, age=0.0):
+        """Store a payload for ``room_code`` that was fetched ``age`` seconds ago."""
+        with self._lock:
+            self._entries[room_code] = _Entry(payload, self._clock() - age)
+            self._prune()
+
+    def invalidate(self, room_code):
+        """Drop the cached payload for ``room_code`` so the next read refetches."""
+        with self._lock:
+            self._entries.pop(room_code, None)
+
+    def clear(self):
+        """Drop every cached payload and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.coalesced = 0
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached rooms."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'rooms': len(self._entries),
+            }
+
+    def _prune(self):
+        if len(self._entries) <= self.max_entries:
+            return
+        now = self._clock()
+        for code in [code for code, entry in self._entries.items() if now - entry.fetched_at >= self.ttl]:
+            del self._entries[code]
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    @staticmethod
+    def _extrapolate(payload, elapsed):
+        """Copy ``payload`` with ``progress_ms`` moved forward by ``elapsed`` seconds if playing."""
+        payload = dict(payload)
+        progress = payload.get('progress_ms')
+        if payload.get('is_playing') and isinstance(progress, int):
+            progress += int(elapsed * 1000)
+            duration = (payload.get('item') or {}).get('duration_ms')
+            if isinstance(duration, int):
+                progress = min(progress, duration)
+            payload['progress_ms'] = progress
+        return payload
+
+
+class TokenCache:
+    """Bounded LRU of ``SpotifyToken`` rows keyed by session id.
+
+    Tokens within ``expiry_margin`` seconds of expiring are treated as misses so the
+    caller reads (and refreshes) the row from the database.
+    """
+
+    def __init__(self, max_entries=256, expiry_margin=60):
+        self.max_entries = max_entries
+        self.expiry_margin = expiry_margin
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id):
+        with self._lock:
+            tokens = self._entries.get(session_id)
+            if tokens is not None and tokens.expires_in > timezone.now() + timedelta(seconds=self.expiry_margin):
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return tokens
+            self._entries.pop(session_id, None)
+            self.misses += 1
+            return None
+
+    def set(self, session_id, tokens):
+        with self._lock:
+            self._entries[session_id] = tokens
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'users': len(self._entries)}
+
+
+now_playing_cache = NowPlayingCache(ttl=getattr(settings, 'SPOTIFY_NOW_PLAYING_TTL', 1.0))
+token_cache = TokenCache(
+    max_entries=getattr(settings, 'SPOTIFY_TOKEN_CACHE_SIZE', 256),
+    expiry_margin=getattr(settings, 'SPOTIFY_TOKEN_CACHE_EXPIRY_MARGIN', 60),
+)
@@ -0,0 +1,81 @@
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from music_controller.metrics import time_upstream
+
+
+class SpotifyClient:
+    """Keep-alive HTTP client for the Spotify Web API and accounts service.
+
+    Calls share one pooled ``requests.Session`` and are bounded by the configured
+    connect and read timeouts.
+    """
+
+    def __init__(self, api_url, accounts_url, connect_timeout=3.05, read_timeout=10.0, pool_size=20):
+        self.api_url = api_url
+        self.accounts_url = accounts_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._session = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            api_url=getattr(settings, 'SPOTIFY_API_URL', 'https://api.spotify.com/v1/me/'),
+            accounts_url=getattr(settings, 'SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com/'),
+            connect_timeout=getattr(settings, 'SPOTIFY_CONNECT_TIMEOUT', 3.05),
+            read_timeout=getattr(settings, 'SPOTIFY_READ_TIMEOUT', 10.0),
+            pool_size=getattr(settings, 'SPOTIFY_POOL_SIZE', 20),
+        )
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def _api_request(self, access_token, endpoint, method):
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f"Bearer {access_token}"
+        }
+        return {'method': method, 'url': self.api_url + endpoint, 'headers': headers}
+
+    def _token_request(self, data):
+        return {'method': 'POST', 'url': self.accounts_url + 'api/token', 'data': data}
+
+    def api(self, access_token, endpoint, method='GET'):
+        """Call a ``me/`` endpoint of the Web API on behalf of ``access_token``."""
+        with time_upstream(endpoint) as call:
+            response = self.session.request(
+                **self._api_request(access_token, endpoint, method),
+                timeout=(self.connect_timeout, self.read_timeout),
+            )
+            call.status = str(response.status_code)
+        return response
+
+    def token(self, data):
+        """POST a grant to the accounts service token endpoint."""
+        with time_upstream('api/token') as call:
+            response = self.session.request(**self._token_request(data), timeout=(self.connect_timeout, self.read_timeout))
+            call.status = str(response.status_code)
+        return response
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+spotify_client = SpotifyClient.from_settings()
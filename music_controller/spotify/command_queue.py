@@ -0,0 +1,195 @@
+import logging
+import threading
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .cache import now_playing_cache
+from .poller import playback_changed
+from .util import pause_song, play_song, skip_song
+
+
+logger = logging.getLogger(__name__)
+
+PLAY, PAUSE, SKIP = 'play', 'pause', 'skip'
+
+
+class _Command:
+    __slots__ = ('id', 'action', 'host', 'song_id')
+
+    def __init__(self, action, host, song_id=None):
+        self.id = uuid.uuid4().hex
+        self.action = action
+        self.host = host
+        self.song_id = song_id
+
+
+class CommandQueue:
+    """Per-room queues of playback commands, sent upstream in order by a small worker pool.
+
+    Redundant commands never reach Spotify: a queued play or pause replaces any
+    play or pause queued after the room's last pending skip, a second skip of the
+    same song joins the first, and at dispatch time a command that the room's
+    last known playback state already satisfies (or a skip of a song this queue
+    already skipped) is dropped. ``execute(host, action)`` sends a command;
+    ``state(room_code)`` returns the last known currently-playing payload or
+    None; ``on_applied(room_code, action)`` runs after each command that was sent
+    and should make ``state`` reflect it.
+    """
+
+    def __init__(self, execute, state=None, on_applied=None, workers=4, history=1024):
+        self.execute = execute
+        self.state = state
+        self.on_applied = on_applied
+        self.workers = workers
+        self.history = history
+        self._lock = threading.Lock()
+        self._rooms = {}
+        self._draining = set()
+        self._outcomes = OrderedDict()
+        self._skipped = OrderedDict()
+        self._executor = None
+        self._counts = Counter()
+
+    def enqueue(self, room_code, host, action, song_id=None):
+        """Queue ``action`` for the room's player and return the id of the command that will carry it."""
+        with self._lock:
+            pending = self._rooms.setdefault(room_code, deque())
+            if action == SKIP:
+                for command in pending:
+                    if command.action == SKIP and command.song_id == song_id:
+                        self._counts['coalesced'] += 1
+                        return command.id
+            else:
+                superseded = []
+                for command in reversed(pending):
+                    if command.action == SKIP:
+                        break
+                    superseded.append(command)
+                for command in superseded:
+                    pending.remove(command)
+                    self._record(command.id, 'coalesced')
+                    self._counts['coalesced'] += 1
+
+            command = _Command(action, host, song_id)
+            pending.append(command)
+            self._record(command.id, 'queued')
+            if room_code not in self._draining:
+                self._draining.add(room_code)
+                self._ensure_started().submit(self._drain, room_code)
+            return command.id
+
+    def outcome(self, command_id):
+        """'queued', 'sent', 'coalesced', 'dropped' or 'failed'; None once forgotten."""
+        with self._lock:
+            return self._outcomes.get(command_id)
+
+    def stats(self):
+        """Commands sent, coalesced, dropped and failed so far, and how many are waiting."""
+        with self._lock:
+            stats = {outcome: self._counts[outcome] for outcome in ('sent', 'coalesced', 'dropped', 'failed')}
+            stats['queued'] = sum(len(pending) for pending in self._rooms.values())
+            return stats
+
+    def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _ensure_started(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='playback-command')
+        return self._executor
+
+    def _record(self, command_id, outcome):
+        self._outcomes[command_id] = outcome
+        self._outcomes.move_to_end(command_id)
+        while len(self._outcomes) > self.history:
+            self._outcomes.popitem(last=False)
+
+    def _drain(self, room_code):
+        try:
+            while True:
+                with self._lock:
+                    pending = self._rooms.get(room_code)
+                    if not pending:
+                        self._rooms.pop(room_code, None)
+                        self._draining.discard(room_code)
+                        return
+                    command = pending.popleft()
+                self._dispatch(room_code, command)
+        finally:
+            close_old_connections()
+
+    def _dispatch(self, room_code, command):
+        if self._satisfied(room_code, command):
+            outcome = 'dropped'
+        else:
+            try:
+                result = self.execute(command.host, command.action)
+            except Exception:
+                logger.exception("Sending %s for room %s failed", command.action, room_code)
+                outcome = 'failed'
+            else:
+                outcome = 'failed' if refused(result) else 'sent'
+                if outcome == 'failed':
+                    logger.warning("Spotify refused %s for room %s: %s", command.action, room_code, result)
+                elif self.on_applied is not None:
+                    self.on_applied(room_code, command.action)
+        with self._lock:
+            if outcome == 'sent' and command.action == SKIP:
+                self._skipped[room_code] = command.song_id
+                self._skipped.move_to_end(room_code)
+                while len(self._skipped) > self.history:
+                    self._skipped.popitem(last=False)
+            self._record(command.id, outcome)
+            self._counts[outcome] += 1
+
+    def _satisfied(self, room_code, command):
+        """Whether the last known playback state already reflects ``command``."""
+        if command.action == SKIP and command.song_id:
+            with self._lock:
+                if self._skipped.get(room_code) == command.song_id:
+                    return True
+        state = self.state(room_code) if self.state is not None else None
+        if not state:
+            return False
+        if command.action == PLAY:
+            return state.get('is_playing') is True
+        if command.action == PAUSE:
+            return state.get('is_playing') is False
+        current = (state.get('item') or {}).get('id')
+        return bool(command.song_id and current and command.song_id != current)
+
+
+def refused(result):
+    """Whether a Spotify API result is an error: Spotify's own ``{'error': {...}}`` body or our ``{'Error': ...}``."""
+    return isinstance(result, dict) and ('error' in result or 'Error' in result)
+
+
+def send_playback_command(host, action):
+    return {PLAY: play_song, PAUSE: pause_song, SKIP: skip_song}[action](host)
+
+
+def playback_command_queue_enabled():
+    return getattr(settings, 'SPOTIFY_COMMAND_QUEUE', True)
+
+
+def command_applied(room_code, action):
+    """Show a sent play/pause in the cached state at once; the next poll confirms or corrects it."""
+    payload = now_playing_cache.peek(room_code)
+    if payload and action in (PLAY, PAUSE):
+        now_playing_cache.publish(room_code, dict(payload, is_playing=action == PLAY))
+    playback_changed(room_code)
+
+
+playback_commands = CommandQueue(
+    send_playback_command,
+    state=now_playing_cache.peek,
+    on_applied=command_applied,
+    workers=getattr(settings, 'SPOTIFY_COMMAND_WORKERS', 4),
+)
@@ -0,0 +1,180 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+TRACK_MS = 180000
+
+
+class _Player:
+    """Playback state of one fake Spotify account."""
+
+    def __init__(self, index):
+        self.index = index
+        self.track = 0
+        self.started_at = time.monotonic()
+        self.paused_at = None
+
+    def progress_ms(self):
+        now = self.paused_at or time.monotonic()
+        progress = int((now - self.started_at) * 1000)
+        if progress >= TRACK_MS:
+            self.next()
+            return 0
+        return progress
+
+    def next(self):
+        self.track += 1
+        self.started_at = time.monotonic()
+        if self.paused_at is not None:
+            self.paused_at = self.started_at
+
+    def pause(self):
+        if self.paused_at is None:
+            self.paused_at = time.monotonic()
+
+    def play(self):
+        if self.paused_at is not None:
+            self.started_at += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+    def payload(self):
+        progress = self.progress_ms()
+        song_id = f'track-{self.index}-{self.track}'
+        return {
+            'is_playing': self.paused_at is None,
+            'progress_ms': progress,
+            'item': {
+                'id': song_id,
+                'name': f'Track {self.track}',
+                'duration_ms': TRACK_MS,
+                'artists': [{'name': f'Artist {self.index}'}],
+                'album': {'images': [{'url': f'https://example.invalid/{song_id}.jpg'}]},
+            },
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload=None, headers=()):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _handle(self, method):
+        server = self.server.fake
+        path = self.path.split('?', 1)[0]
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        server.record(method, path)
+
+        if server.latency:
+            time.sleep(random.uniform(0.5, 1.5) * server.latency)
+        if random.random() < server.rate_limit_rate:
+            return self._send(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                              [('Retry-After', str(server.retry_after))])
+        if random.random() < server.error_rate:
+            return self._send(500, {'error': {'status': 500, 'message': 'Server error'}})
+
+        if path == '/api/token' and method == 'POST':
+            form = parse_qs(body.decode())
+            grant = form.get('code', form.get('refresh_token', ['anonymous']))[0]
+            return self._send(200, {
+                'access_token': f'access-{grant}', 'token_type': 'Bearer',
+                'expires_in': 3600, 'refresh_token': grant,
+            })
+
+        if not path.startswith('/v1/me/player'):
+            return self._send(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+        player = server.player(self.headers.get('Authorization', ''))
+        action = path[len('/v1/me/player'):]
+        with server.lock:
+            if method == 'GET' and action in ('', '/currently-playing'):
+                return self._send(200, player.payload())
+            if method == 'PUT' and action == '/play':
+                player.play()
+            elif method == 'PUT' and action == '/pause':
+                player.pause()
+            elif method == 'POST' and action == '/next':
+                player.next()
+            else:
+                return self._send(404, {'error': {'status': 404, 'message': 'Not found'}})
+        return self._send(204)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class FakeSpotify:
+    """Local stand-in for the Spotify ``me/player/*`` and ``accounts/api/token`` endpoints.
+
+    Each access token gets its own simulated player. ``latency`` (seconds, jittered
+    ±50%), ``error_rate`` (HTTP 500) and ``rate_limit_rate`` (HTTP 429 with
+    ``Retry-After: retry_after``) shape every response.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self._players = {}
+        self._server = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}/'
+
+    def player(self, authorization):
+        with self.lock:
+            player = self._players.get(authorization)
+            if player is None:
+                player = self._players[authorization] = _Player(len(self._players))
+            return player
+
+    def record(self, method, path):
+        with self.lock:
+            self.calls[f'{method} {path}'] += 1
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, name='fake-spotify', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
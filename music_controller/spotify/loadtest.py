@@ -0,0 +1,141 @@
+import heapq
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connection
+from django.test import Client
+
+from .client import spotify_client
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class _Stats:
+    """Per-endpoint latency samples, status counts and DB query counts."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.queries = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, name, latency, status, queries):
+        with self.lock:
+            self.latency[name].append(latency)
+            self.queries[name] += queries
+            self.statuses[name][status] += 1
+
+
+class LoadTest:
+    """Drive N rooms x M listeners against the app in-process.
+
+    Hosts create rooms through ``/api/create-room`` and authorise through
+    ``/spotify/redirect`` (answered by the fake accounts service); guests join
+    through ``/api/join-room``. Every listener then polls ``/spotify/current-song``
+    each ``poll_interval`` seconds and votes to skip with probability
+    ``vote_rate`` per poll. Requests run on a pool of ``workers`` threads, like a
+    threaded app server, and latency includes time spent queued for a worker.
+    """
+
+    def __init__(self, fake, rooms=5, listeners=10, duration=30.0, poll_interval=1.0, vote_rate=0.01, workers=8):
+        self.fake = fake
+        self.rooms = rooms
+        self.listeners = listeners
+        self.duration = duration
+        self.poll_interval = poll_interval
+        self.vote_rate = vote_rate
+        self.workers = workers
+        self.stats = _Stats()
+
+    def _request(self, client, name, method, path, started=None, **kwargs):
+        queries = []
+        start = time.perf_counter() if started is None else started
+        with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+            response = getattr(client, method)(path, **kwargs)
+        self.stats.add(name, time.perf_counter() - start, response.status_code, len(queries))
+        return response
+
+    def setup(self):
+        listeners = []
+        for i in range(self.rooms):
+            host = Client()
+            code = self._request(host, 'create-room', 'post', '/api/create-room',
+                                 data={'guest_can_pause': True, 'votes_to_skip': max(2, self.listeners // 2)},
+                                 content_type='application/json').json()['code']
+            self._request(host, 'redirect', 'get', '/spotify/redirect', data={'code': f'room-{i}'})
+            listeners.append(host)
+            for _ in range(self.listeners - 1):
+                guest = Client()
+                self._request(guest, 'join-room', 'post', '/api/join-room', data={'code': code},
+                              content_type='application/json')
+                listeners.append(guest)
+        return listeners
+
+    def _listener_tick(self, client, due):
+        try:
+            self._request(client, 'current-song', 'get', '/spotify/current-song', started=due)
+            if random.random() < self.vote_rate:
+                self._request(client, 'skip', 'post', '/spotify/skip')
+        finally:
+            close_old_connections()
+
+    def run(self):
+        original_urls = spotify_client.api_url, spotify_client.accounts_url
+        spotify_client.api_url = self.fake.url + 'v1/me/'
+        spotify_client.accounts_url = self.fake.url
+        try:
+            listeners = self.setup()
+            self.fake.calls.clear()
+            self.stats = _Stats()
+            started = time.perf_counter()
+            self._drive(listeners, started + self.duration)
+            elapsed = time.perf_counter() - started
+        finally:
+            spotify_client.api_url, spotify_client.accounts_url = original_urls
+        return self.report(elapsed)
+
+    def _drive(self, listeners, deadline):
+        now = time.perf_counter()
+        heap = [(now + random.uniform(0, self.poll_interval), i) for i in range(len(listeners))]
+        heapq.heapify(heap)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while heap:
+                due, i = heapq.heappop(heap)
+                if due >= deadline:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._listener_tick, listeners[i], due)
+                heapq.heappush(heap, (due + self.poll_interval, i))
+
+    def report(self, elapsed):
+        stats = self.stats
+        total = sum(len(samples) for samples in stats.latency.values())
+        upstream = sum(self.fake.calls.values())
+        return {
+            'elapsed': elapsed,
+            'requests': total,
+            'throughput': total / elapsed if elapsed else 0.0,
+            'upstream_calls_per_second': upstream / elapsed if elapsed else 0.0,
+            'upstream_calls': dict(self.fake.calls),
+            'endpoints': {
+                name: {
+                    'requests': len(samples),
+                    'p50': percentile(samples, 50),
+                    'p95': percentile(samples, 95),
+                    'p99': percentile(samples, 99),
+                    'queries_per_request': stats.queries[name] / len(samples),
+                    'statuses': dict(stats.statuses[name]),
+                }
+                for name, samples in stats.latency.items()
+            },
+        }
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from spotify.query_audit import EXPECTED_SCANS, audit_queries
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN QUERY PLAN every ORM query issued by the api and spotify views; fail on full table scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--allow', action='append', default=[], metavar='LABEL',
+                            help="Scenario label whose full scans are expected (may be repeated).")
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"explain_queries understands SQLite query plans only, not {connection.vendor}.")
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = audit_queries(allow_scans=EXPECTED_SCANS | set(options['allow']))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        failures = 0
+        for label, sql, plan, scans in results:
+            if scans:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"[FULL SCAN of {', '.join(scans)}] {label}"))
+            elif verbosity < 2:
+                continue
+            else:
+                self.stdout.write(self.style.SUCCESS(f"[ok] {label}"))
+            self.stdout.write(f"    {sql}")
+            for line in plan:
+                self.stdout.write(f"      {line}")
+
+        if failures:
+            raise CommandError(f"{failures} of {len(results)} queries scan a full table.")
+        self.stdout.write(f"No unexpected full table scans in {len(results)} queries.")
@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from spotify.fake_spotify import FakeSpotify
+from spotify.loadtest import LoadTest
+from spotify.poller import playback_poller
+from spotify.tokens import token_refresher
+
+
+class Command(BaseCommand):
+    help = "Load-test N rooms x M listeners in-process against a local fake Spotify."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=5)
+        parser.add_argument('--listeners', type=int, default=10, help="Listeners per room, host included.")
+        parser.add_argument('--duration', type=float, default=30.0, help="Seconds of steady-state polling.")
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--vote-rate', type=float, default=0.01, help="Chance a listener votes to skip per poll.")
+        parser.add_argument('--workers', type=int, default=8, help="Request worker threads.")
+        parser.add_argument('--latency', type=float, default=0.05, help="Fake Spotify latency in seconds.")
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+        parser.add_argument('--retry-after', type=int, default=1)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # A file-backed database so request threads and the poller share it like a real deployment.
+        tmpdir = tempfile.TemporaryDirectory()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir.name, 'loadtest.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        fake = FakeSpotify(options['latency'], options['error_rate'], options['rate_limit_rate'], options['retry_after'])
+        try:
+            with fake:
+                report = LoadTest(
+                    fake,
+                    rooms=options['rooms'],
+                    listeners=options['listeners'],
+                    duration=options['duration'],
+                    poll_interval=options['poll_interval'],
+                    vote_rate=options['vote_rate'],
+                    workers=options['workers'],
+                ).run()
+                playback_poller.stop()
+                token_refresher.stop()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            tmpdir.cleanup()
+
+        self.write_report(report)
+
+    def write_report(self, report):
+        self.stdout.write(
+            f"{report['requests']} requests in {report['elapsed']:.1f}s "
+            f"({report['throughput']:.1f} req/s), "
+            f"{report['upstream_calls_per_second']:.2f} upstream calls/s"
+        )
+        self.stdout.write(f"{'endpoint':<14}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}  statuses")
+        for name, row in sorted(report['endpoints'].items()):
+            self.stdout.write(
+                f"{name:<14}{row['requests']:>9}{row['p50'] * 1000:>9.1f}{row['p95'] * 1000:>9.1f}"
+                f"{row['p99'] * 1000:>9.1f}{row['queries_per_request']:>9.2f}  {row['statuses']}"
+            )
+        for call, count in sorted(report['upstream_calls'].items()):
+            self.stdout.write(f"  upstream {call}: {count}")
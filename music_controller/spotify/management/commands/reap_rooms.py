@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from spotify.reaper import RoomReaper, reap, room_reaper
+
+
+class Command(BaseCommand):
+    help = "Delete idle rooms, stale votes, orphaned Spotify tokens and expired sessions in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle-timeout', type=int, default=room_reaper.idle_timeout,
+                            help="Delete rooms with no activity for this many seconds.")
+        parser.add_argument('--batch-size', type=int, default=room_reaper.batch_size,
+                            help="Rows deleted per transaction.")
+        parser.add_argument('--pause', type=float, default=room_reaper.pause,
+                            help="Seconds to sleep between batches.")
+        parser.add_argument('--loop', action='store_true', help="Keep running, reaping every --interval seconds.")
+        parser.add_argument('--interval', type=int, default=room_reaper.interval)
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            reaper = RoomReaper(options['idle_timeout'], options['interval'], options['batch_size'], options['pause'])
+            try:
+                reaper.run()
+            except KeyboardInterrupt:
+                pass
+            return
+
+        deleted = reap(options['idle_timeout'], options['batch_size'], options['pause'])
+        if not deleted:
+            self.stdout.write("Nothing to reap.")
+        for label, count in sorted(deleted.items()):
+            self.stdout.write(f"Deleted {count} {label}.")
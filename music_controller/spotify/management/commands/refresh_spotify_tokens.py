@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from spotify.tokens import TokenRefresher, refresh_expiring_tokens, token_refresher
+
+
+class Command(BaseCommand):
+    help = "Refresh Spotify tokens that expire within the configured margin."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--margin', type=int, default=token_refresher.margin,
+                            help="Refresh tokens expiring within this many seconds.")
+        parser.add_argument('--batch-size', type=int, default=token_refresher.batch_size)
+        parser.add_argument('--loop', action='store_true', help="Keep running, refreshing every --interval seconds.")
+        parser.add_argument('--interval', type=int, default=token_refresher.interval)
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            refresher = TokenRefresher(options['margin'], options['interval'], options['batch_size'])
+            try:
+                refresher.run()
+            except KeyboardInterrupt:
+                pass
+            return
+
+        refreshed = refresh_expiring_tokens(options['margin'], options['batch_size'])
+        self.stdout.write(f"Refreshed {refreshed} token(s).")
@@ -0,0 +1,29 @@
+from .cache import now_playing_cache, token_cache
+from .command_queue import playback_commands
+from .poller import playback_poller
+from .ratelimit import upstream_dispatcher
+
+
+def collect():
+    """Scrape-time values of the spotify app's in-process caches, poller, rate limiter and command queue."""
+    playing = now_playing_cache.stats()
+    tokens = token_cache.stats()
+    upstream = upstream_dispatcher.stats()
+    commands = playback_commands.stats()
+    return [
+        ('now_playing_cache_hits_total', 'counter', 'Now-playing reads served from the cache.', playing['hits']),
+        ('now_playing_cache_misses_total', 'counter', 'Now-playing reads that found no cached state.', playing['misses']),
+        ('now_playing_cache_coalesced_total', 'counter', 'Now-playing misses that waited on another fetch.', playing['coalesced']),
+        ('now_playing_cache_rooms', 'gauge', 'Rooms with cached now-playing state.', playing['rooms']),
+        ('token_cache_hits_total', 'counter', 'Token lookups served from memory.', tokens['hits']),
+        ('token_cache_misses_total', 'counter', 'Token lookups that went to the database.', tokens['misses']),
+        ('playback_polls_total', 'counter', 'Background now-playing polls completed.', playback_poller.polls),
+        ('playback_poller_rooms', 'gauge', 'Rooms with an active background poll.', len(playback_poller.active_rooms())),
+        ('spotify_throttled_total', 'counter', 'Upstream calls refused locally by the rate limiter.', upstream['throttled']),
+        ('spotify_rate_limited_total', 'counter', 'HTTP 429 responses received from Spotify.', upstream['rate_limited_responses']),
+        ('playback_commands_sent_total', 'counter', 'Queued playback commands sent to Spotify.', commands['sent']),
+        ('playback_commands_coalesced_total', 'counter', 'Playback commands merged into a later or identical one.', commands['coalesced']),
+        ('playback_commands_dropped_total', 'counter', 'Playback commands the known state already satisfied.', commands['dropped']),
+        ('playback_commands_failed_total', 'counter', 'Playback commands Spotify refused or that errored.', commands['failed']),
+        ('playback_commands_queued', 'gauge', 'Playback commands waiting to be sent.', commands['queued']),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_tallies(apps, schema_editor):
+    Vote = apps.get_model('spotify', 'Vote')
+    VoteTally = apps.get_model('spotify', 'VoteTally')
+    VoteTally.objects.bulk_create(
+        VoteTally(room_id=row['room_id'], song_id=row['song_id'], count=row['count'])
+        for row in Vote.objects.values('room_id', 'song_id').annotate(count=Count('id'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_room_current_song'),
+        ('spotify', '0002_vote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('song_id', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('skipped', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='user',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'room', 'song_id'), name='unique_vote_per_song'),
+        ),
+        migrations.AddField(
+            model_name='votetally',
+            name='room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.room'),
+        ),
+        migrations.AddConstraint(
+            model_name='votetally',
+            constraint=models.UniqueConstraint(fields=('room', 'song_id'), name='unique_tally_per_song'),
+        ),
+        migrations.RunPython(backfill_tallies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_room_current_song'),
+        ('spotify', '0003_vote_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='vote',
+            name='unique_vote_per_song',
+        ),
+        migrations.AlterField(
+            model_name='spotifytoken',
+            name='expires_in',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('room', 'song_id', 'user'), name='unique_vote_per_song'),
+        ),
+    ]
@@ -7,11 +7,28 @@ class SpotifyToken(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     refresh_token = models.CharField(max_length=150)
     access_token = models.CharField(max_length=150)
-    expires_in = models.DateTimeField()
+    expires_in = models.DateTimeField(db_index=True)
     token_type = models.CharField(max_length=50)
 
 class Vote(models.Model):
-    user = models.CharField(max_length=50, unique=True)
+    user = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
     song_id = models.CharField(max_length=50)
-    room = models.ForeignKey(Room, on_delete=models.CASCADE)
\ No newline at end of file
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            # Room first so the index also serves per-room and per-song lookups.
+            models.UniqueConstraint(fields=['room', 'song_id', 'user'], name='unique_vote_per_song'),
+        ]
+
+class VoteTally(models.Model):
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    song_id = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+    skipped = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'song_id'], name='unique_tally_per_song'),
+        ]
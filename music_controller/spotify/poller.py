@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from api.changes import room_changes
+from api.models import Room
+from music_controller.shared_state import shared_state
+from .cache import now_playing_cache
+from .ratelimit import RateLimited
+from .reaper import room_reaper
+from .tokens import token_refresher
+from .util import execute_spotify_api_request, update_room_song
+
+
+logger = logging.getLogger(__name__)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _RoomSchedule:
+    """Polling state for one active room."""
+    __slots__ = ('host', 'last_seen', 'due', 'polling', 'stale', 'forced', 'song_id', 'first_poll', 'waiters')
+
+    def __init__(self, host, now):
+        self.host = host
+        self.last_seen = now
+        self.due = now
+        self.polling = False
+        self.stale = False
+        self.forced = False
+        self.song_id = None
+        self.first_poll = threading.Event()
+        self.waiters = []
+
+
+class PlaybackPoller:
+    """Keeps one background polling task per active room and publishes results to ``cache``.
+
+    A room becomes active on its first :meth:`read` or :meth:`touch` and is dropped
+    once nobody has read it for ``idle_timeout`` seconds. While a track plays, the
+    next poll is timed to the end of the track, capped at ``max_interval``.
+    ``on_publish(room_code)`` runs after every successful poll.
+
+    With a shared ``store``, only the worker holding a room's ``poll:<code>``
+    lease (renewed on every poll, ``lease_ttl`` seconds) calls Spotify; it puts
+    each payload in the store, and the other workers get it through
+    :meth:`receive` or read it from the store when their own poll falls due.
+    """
+
+    def __init__(self, cache, fetch, on_song_change=None, on_publish=None, min_interval=1.0, max_interval=5.0,
+                 idle_timeout=30.0, workers=4, store=None, lease_ttl=15.0, clock=time.monotonic):
+        self.cache = cache
+        self.fetch = fetch
+        self.on_song_change = on_song_change
+        self.on_publish = on_publish
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_timeout = idle_timeout
+        self.workers = workers
+        self.store = store
+        self.lease_ttl = lease_ttl
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._rooms = {}
+        self._thread = None
+        self._executor = None
+        self._stopped = False
+        self.polls = 0
+
+    def touch(self, room_code, host):
+        """Mark ``room_code`` as having a listener, scheduling it if it was idle."""
+        with self._cond:
+            now = self._clock()
+            schedule = self._rooms.get(room_code)
+            if schedule is None:
+                schedule = self._rooms[room_code] = _RoomSchedule(host, now)
+                self._cond.notify()
+            schedule.host = host
+            schedule.last_seen = now
+            self._ensure_started()
+            return schedule
+
+    def read(self, room_code, host, timeout=5.0):
+        """Return the room's last published payload, waiting up to ``timeout`` for a new room's first poll."""
+        schedule = self.touch(room_code, host)
+        payload = self.cache.peek(room_code)
+        if payload is None and schedule.first_poll.wait(timeout):
+            payload = self.cache.peek(room_code)
+        return payload
+
+    async def aread(self, room_code, host, timeout=5.0):
+        """Like :meth:`read`, but waiting for a new room's first poll does not hold a thread."""
+        schedule = self.touch(room_code, host)
+        payload = self.cache.peek(room_code)
+        if payload is None:
+            loop = asyncio.get_running_loop()
+            waiter = loop.create_future()
+            with self._cond:
+                if not schedule.first_poll.is_set():
+                    schedule.waiters.append((loop, waiter))
+                else:
+                    waiter.set_result(None)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                with self._cond:
+                    if (loop, waiter) in schedule.waiters:
+                        schedule.waiters.remove((loop, waiter))
+                return None
+            payload = self.cache.peek(room_code)
+        return payload
+
+    def refresh(self, room_code):
+        """Poll ``room_code`` as soon as possible, e.g. after a playback command, even without its lease."""
+        with self._cond:
+            schedule = self._rooms.get(room_code)
+            if schedule is not None:
+                schedule.due = self._clock()
+                schedule.stale = schedule.polling
+                schedule.forced = True
+                self._cond.notify()
+
+    def receive(self, room_code, shared):
+        """Publish a payload another worker polled for ``room_code``, if this worker has listeners for it."""
+        with self._cond:
+            schedule = self._rooms.get(room_code)
+        if schedule is None:
+            return
+        self.cache.publish(room_code, shared['payload'], age=max(0.0, time.time() - shared['at']))
+        if self.on_publish is not None:
+            self.on_publish(room_code)
+        self._first_poll_done(schedule)
+
+    def active_rooms(self):
+        with self._cond:
+            return list(self._rooms)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+            thread, executor = self._thread, self._executor
+        if thread is not None:
+            thread.join()
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._cond:
+            self._thread = self._executor = None
+            self._rooms.clear()
+            self._stopped = False
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='playback-poll')
+            self._thread = threading.Thread(target=self._run, name='playback-poller', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        with self._cond:
+            while not self._stopped:
+                now = self._clock()
+                wait = self.idle_timeout
+                for room_code, schedule in list(self._rooms.items()):
+                    if schedule.polling:
+                        continue
+                    if now - schedule.last_seen >= self.idle_timeout:
+                        del self._rooms[room_code]
+                        self.cache.invalidate(room_code)
+                        continue
+                    if schedule.due <= now:
+                        schedule.polling = True
+                        self._executor.submit(self._poll, room_code, schedule)
+                    else:
+                        wait = min(wait, schedule.due - now)
+                self._cond.wait(wait)
+
+    def _poll(self, room_code, schedule):
+        payload = None
+        backoff = 0
+        leader = True
+        try:
+            with self._cond:
+                forced, schedule.forced = schedule.forced, False
+            leader = forced or self.store is None or self.store.claim(f'poll:{room_code}', self.lease_ttl)
+            if leader:
+                payload = self.fetch(schedule.host)
+                self.cache.publish(room_code, payload)
+                if self.store is not None:
+                    self.store.put('now_playing', room_code, {'payload': payload, 'at': time.time()})
+                song_id = (payload.get('item') or {}).get('id')
+                if self.on_song_change is not None and song_id and song_id != schedule.song_id:
+                    self.on_song_change(room_code, song_id)
+                schedule.song_id = song_id
+            else:
+                # Another worker polls this room; its payloads normally arrive through receive() first.
+                shared = self.store.get('now_playing', room_code)
+                if shared is not None:
+                    payload = shared['payload']
+                    self.cache.publish(room_code, payload, age=max(0.0, time.time() - shared['at']))
+            if payload is not None and self.on_publish is not None:
+                self.on_publish(room_code)
+        except RateLimited as e:
+            backoff = e.retry_after  # Keep serving the last published state meanwhile.
+        except Exception:
+            logger.exception("Polling playback for room %s failed", room_code)
+        finally:
+            with self._cond:
+                self.polls += 1
+                schedule.polling = False
+                if leader or payload is not None:
+                    delay = 0 if schedule.stale else self.next_delay(payload)
+                else:
+                    delay = self.min_interval  # The lease holder has not published yet.
+                schedule.due = self._clock() + max(delay, backoff)
+                schedule.stale = False
+                self._cond.notify()
+            if leader or payload is not None:
+                self._first_poll_done(schedule)
+
+    def _first_poll_done(self, schedule):
+        with self._cond:
+            schedule.first_poll.set()
+            waiters, schedule.waiters = schedule.waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def next_delay(self, payload):
+        """Seconds until the next poll: the remaining track time, clamped to the poll interval bounds."""
+        if not payload or not payload.get('is_playing'):
+            return self.max_interval
+        duration = (payload.get('item') or {}).get('duration_ms')
+        progress = payload.get('progress_ms')
+        if not isinstance(duration, int) or not isinstance(progress, int):
+            return self.max_interval
+        remaining = (duration - progress) / 1000
+        return max(self.min_interval, min(self.max_interval, remaining))
+
+
+def fetch_currently_playing(host):
+    try:
+        return execute_spotify_api_request(host, "player/currently-playing", background=True)
+    finally:
+        close_old_connections()
+
+
+def record_song_change(room_code, song_id):
+    """Persist a new current song and clear stale votes, off the request path."""
+    try:
+        room = Room.objects.filter(code=room_code).first()
+        if room:
+            update_room_song(room, song_id)
+    finally:
+        close_old_connections()
+
+
+def polling_enabled():
+    return getattr(settings, 'SPOTIFY_BACKGROUND_POLLING', True)
+
+
+def _start_background_tasks():
+    shared_state.ensure_started()
+    if getattr(settings, 'SPOTIFY_TOKEN_REFRESH_IN_BACKGROUND', True):
+        token_refresher.ensure_started()
+    if getattr(settings, 'ROOM_REAPER_IN_BACKGROUND', False):
+        room_reaper.ensure_started()
+
+
+def read_now_playing(room):
+    """Return the raw currently-playing payload for ``room`` from the shared store."""
+    _start_background_tasks()
+    if polling_enabled():
+        return playback_poller.read(room.code, room.host) or {}
+
+    try:
+        response = now_playing_cache.get(
+            room.code, lambda: execute_spotify_api_request(room.host, "player/currently-playing", background=True)
+        )
+    except RateLimited:
+        return now_playing_cache.peek(room.code) or {}
+    song_id = (response.get('item') or {}).get('id')
+    if song_id:
+        update_room_song(room, song_id)
+    return response
+
+
+async def aread_now_playing(room):
+    """Async :func:`read_now_playing`; waiting for a new room's first poll does not hold a thread."""
+    if polling_enabled():
+        _start_background_tasks()
+        return await playback_poller.aread(room.code, room.host) or {}
+    return await sync_to_async(read_now_playing)(room)
+
+
+def playback_changed(room_code):
+    """Make the next read of ``room_code`` reflect a playback command."""
+    if polling_enabled():
+        playback_poller.refresh(room_code)
+    else:
+        now_playing_cache.invalidate(room_code)
+        room_changes.notify(room_code)
+
+
+playback_poller = PlaybackPoller(
+    now_playing_cache,
+    fetch=fetch_currently_playing,
+    on_song_change=record_song_change,
+    on_publish=room_changes.notify,
+    min_interval=getattr(settings, 'SPOTIFY_POLL_MIN_INTERVAL', 1.0),
+    max_interval=getattr(settings, 'SPOTIFY_POLL_MAX_INTERVAL', 5.0),
+    idle_timeout=getattr(settings, 'SPOTIFY_POLL_IDLE_TIMEOUT', 30.0),
+    workers=getattr(settings, 'SPOTIFY_POLL_WORKERS', 4),
+    store=shared_state,
+    lease_ttl=getattr(settings, 'SPOTIFY_POLL_LEASE_TTL', 15.0),
+)
+shared_state.subscribe('now_playing', playback_poller.receive)
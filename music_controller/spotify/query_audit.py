@@ -0,0 +1,126 @@
+import json
+import re
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import util, views
+from .models import SpotifyToken
+from .tokens import refresh_expiring_tokens
+
+
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(?!CONSTANT ROW)(\S+)$')
+
+# Scenarios whose full scans are inherent to what the view returns.
+EXPECTED_SCANS = set()
+
+
+class _FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = json.dumps(payload).encode() if payload else b''
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class _FakeSpotifyClient:
+    """Canned upstream responses so the audit only exercises our own queries."""
+
+    def api(self, access_token, endpoint, method='GET'):
+        if endpoint == 'player/currently-playing':
+            return _FakeResponse({
+                'is_playing': True,
+                'progress_ms': 1000,
+                'item': {'id': 'audit-song', 'name': 'Audit', 'duration_ms': 200000, 'artists': [], 'album': {'images': [{}]}},
+            })
+        return _FakeResponse(None, status_code=204)
+
+    def token(self, data):
+        return _FakeResponse({
+            'access_token': 'audit-access', 'token_type': 'Bearer', 'expires_in': 3600, 'refresh_token': 'audit-refresh',
+        })
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _scenarios(host, guest):
+    """(label, callable) pairs covering every api and spotify view, in a realistic order."""
+    code = {}
+
+    def create_room():
+        response = host.post('/api/create-room', {'guest_can_pause': True, 'votes_to_skip': 2}, content_type='application/json')
+        code['value'] = response.json()['code']
+        SpotifyToken.objects.create(
+            user=host.session.session_key, access_token='a', refresh_token='r', token_type='Bearer',
+            expires_in=timezone.now() + timedelta(seconds=60),
+        )
+        return response
+
+    return [
+        ('api: create-room', create_room),
+        ('api: get-room', lambda: host.get('/api/get-room', {'code': code['value']})),
+        ('api: update-room', lambda: host.patch(
+            '/api/update-room', {'guest_can_pause': True, 'votes_to_skip': 3, 'code': code['value']},
+            content_type='application/json')),
+        ('api: room', lambda: host.get('/api/room')),
+        ('api: room?active', lambda: host.get('/api/room', {'active': 1, 'fields': 'code,votes_to_skip'})),
+        ('api: join-room', lambda: guest.post('/api/join-room', {'code': code['value']}, content_type='application/json')),
+        ('api: user-in-room', lambda: guest.get('/api/user-in-room')),
+        ('spotify: redirect', lambda: host.get('/spotify/redirect', {'code': 'audit'})),
+        ('spotify: is-authenticated', lambda: host.get('/spotify/is-authenticated')),
+        ('spotify: current-song', lambda: guest.get('/spotify/current-song')),
+        ('spotify: pause', lambda: guest.put('/spotify/pause')),
+        ('spotify: play', lambda: guest.put('/spotify/play')),
+        ('spotify: skip (vote)', lambda: guest.post('/spotify/skip')),
+        ('spotify: skip (host)', lambda: host.post('/spotify/skip')),
+        ('spotify: room-states', lambda: guest.get('/spotify/room-states', {'codes': code['value']})),
+        ('spotify: token refresher', lambda: refresh_expiring_tokens(margin=300)),
+        ('api: leave-room', lambda: host.post('/api/leave-room')),
+    ]
+
+
+def explain(sql):
+    """Return the EXPLAIN QUERY PLAN detail lines for ``sql``."""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def audit_queries(allow_scans=EXPECTED_SCANS):
+    """Run every view against throwaway data and explain each query it issued.
+
+    Returns a list of ``(label, sql, plan, full_scans)`` tuples. All writes are rolled back.
+    """
+    if connection.vendor != 'sqlite':
+        raise ValueError("The query audit understands SQLite query plans only.")
+
+    host, guest = Client(), Client()
+    results = []
+    settings = override_settings(SPOTIFY_BACKGROUND_POLLING=False, SPOTIFY_TOKEN_REFRESH_IN_BACKGROUND=False)
+    fake = _FakeSpotifyClient()
+    try:
+        with settings, mock.patch.object(util, 'spotify_client', fake), mock.patch.object(views, 'spotify_client', fake), \
+                transaction.atomic():
+            for label, run in _scenarios(host, guest):
+                with CaptureQueriesContext(connection) as captured:
+                    run()
+                for query in captured.captured_queries:
+                    sql = query['sql']
+                    if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                        continue
+                    plan = explain(sql)
+                    scans = [] if label in allow_scans else [m.group(1) for m in map(FULL_SCAN.match, plan) if m]
+                    results.append((label, sql, plan, scans))
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return results
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class RateLimited(Exception):
+    """An upstream call was refused locally because Spotify asked us to slow down."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limited by Spotify, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value, default=1.0):
+    """Seconds to wait from a ``Retry-After`` header given as delta-seconds or an HTTP date."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - timezone.now()).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``rate`` tokens per second."""
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now, reserve=0):
+        """Seconds until a token can be taken while leaving ``reserve`` tokens behind."""
+        self._refill(now)
+        missing = 1 + reserve - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self):
+        self.tokens -= 1
+
+
+class UpstreamDispatcher:
+    """Admission control for Spotify Web API calls.
+
+    Every call takes a token from a global bucket and from its host's bucket.
+    Background polls must leave ``command_reserve`` tokens in both, so user
+    commands (play/pause/skip) keep getting through when polls are throttled.
+    A 429 response blocks all calls until its ``Retry-After`` has passed, since
+    Spotify rate limits are per client id.
+    """
+
+    def __init__(self, global_rate=10.0, global_burst=20, host_rate=2.0, host_burst=5,
+                 command_reserve=2, max_hosts=1024, clock=time.monotonic):
+        self.global_rate = global_rate
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.command_reserve = command_reserve
+        self.max_hosts = max_hosts
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._global = TokenBucket(global_rate, global_burst, clock())
+        self._hosts = OrderedDict()
+        self._blocked_until = 0.0
+        self.throttled = 0
+        self.rate_limited_responses = 0
+
+    def _host_bucket(self, host, now):
+        bucket = self._hosts.get(host)
+        if bucket is None:
+            bucket = self._hosts[host] = TokenBucket(self.host_rate, self.host_burst, now)
+            while len(self._hosts) > self.max_hosts:
+                self._hosts.popitem(last=False)
+        self._hosts.move_to_end(host)
+        return bucket
+
+    def acquire(self, host, background=False, timeout=2.0):
+        """Admit one call for ``host`` or raise :class:`RateLimited`.
+
+        Background calls never wait; commands wait up to ``timeout`` seconds.
+        """
+        reserve = self.command_reserve if background else 0
+        with self._cond:
+            deadline = self._clock() + (0 if background else timeout)
+            while True:
+                now = self._clock()
+                bucket = self._host_bucket(host, now)
+                wait = max(
+                    self._blocked_until - now,
+                    self._global.wait_time(now, reserve),
+                    bucket.wait_time(now, reserve),
+                )
+                if wait <= 0:
+                    self._global.take()
+                    bucket.take()
+                    return
+                if now + wait > deadline:
+                    self.throttled += 1
+                    raise RateLimited(wait)
+                self._cond.wait(wait)
+
+    def record(self, status_code, retry_after=None):
+        """Feed an upstream response back; a 429 blocks calls for its ``Retry-After``."""
+        if status_code != 429:
+            return
+        delay = parse_retry_after(retry_after)
+        with self._cond:
+            self.rate_limited_responses += 1
+            self._blocked_until = max(self._blocked_until, self._clock() + delay)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'throttled': self.throttled,
+                'rate_limited_responses': self.rate_limited_responses,
+                'blocked_for': max(0.0, self._blocked_until - self._clock()),
+            }
+
+
+upstream_dispatcher = UpstreamDispatcher(
+    global_rate=getattr(settings, 'SPOTIFY_RATE_LIMIT_GLOBAL_RATE', 10.0),
+    global_burst=getattr(settings, 'SPOTIFY_RATE_LIMIT_GLOBAL_BURST', 20),
+    host_rate=getattr(settings, 'SPOTIFY_RATE_LIMIT_HOST_RATE', 2.0),
+    host_burst=getattr(settings, 'SPOTIFY_RATE_LIMIT_HOST_BURST', 5),
+    command_reserve=getattr(settings, 'SPOTIFY_RATE_LIMIT_COMMAND_RESERVE', 2),
+)
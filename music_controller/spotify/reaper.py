@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from api.models import Room
+from .models import SpotifyToken, Vote, VoteTally
+
+
+logger = logging.getLogger(__name__)
+
+DB_SESSION_ENGINES = ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db')
+
+
+def delete_in_batches(select, batch_size=100, pause=0.0):
+    """Delete the rows ``select()`` returns, ``batch_size`` primary keys per transaction.
+
+    Each batch re-applies ``select()`` inside its transaction, so a row that stopped
+    matching since it was picked (e.g. a room that became active again) survives.
+    Sleeps ``pause`` seconds between batches to let live writers take the lock.
+    Returns deleted row counts per model label, cascades included.
+    """
+    deleted = Counter()
+    while True:
+        pks = list(select().values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            _, per_model = select().filter(pk__in=pks).delete()
+        deleted.update(per_model)
+        if len(pks) < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def idle_rooms(cutoff):
+    return Room.objects.filter(last_activity__lt=cutoff)
+
+
+def stale_votes():
+    """Votes on anything other than their room's current song (left behind by a missed song change)."""
+    return Vote.objects.exclude(song_id=F('room__current_song'))
+
+
+def stale_tallies():
+    return VoteTally.objects.exclude(song_id=F('room__current_song'))
+
+
+def orphaned_tokens(cutoff):
+    """Tokens of users who host no room and either have no live session or stopped refreshing before ``cutoff``."""
+    tokens = SpotifyToken.objects.filter(~Exists(Room.objects.filter(host=OuterRef('user'))))
+    abandoned = Q(expires_in__lt=cutoff)
+    if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        live_session = Session.objects.filter(session_key=OuterRef('user'), expire_date__gt=timezone.now())
+        abandoned |= ~Exists(live_session)
+    return tokens.filter(abandoned)
+
+
+def expired_sessions():
+    return Session.objects.filter(expire_date__lt=timezone.now())
+
+
+def reap(idle_timeout, batch_size=100, pause=0.0):
+    """Delete rooms idle for ``idle_timeout`` seconds and the rows nothing can reach any more.
+
+    Returns deleted row counts per model label.
+    """
+    cutoff = timezone.now() - timedelta(seconds=idle_timeout)
+    deleted = Counter()
+    deleted.update(delete_in_batches(lambda: idle_rooms(cutoff), batch_size, pause))
+    deleted.update(delete_in_batches(stale_votes, batch_size, pause))
+    deleted.update(delete_in_batches(stale_tallies, batch_size, pause))
+    deleted.update(delete_in_batches(lambda: orphaned_tokens(cutoff), batch_size, pause))
+    if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        deleted.update(delete_in_batches(expired_sessions, batch_size, pause))
+    return dict(deleted)
+
+
+class RoomReaper:
+    """Background thread that runs :func:`reap` every ``interval`` seconds."""
+
+    def __init__(self, idle_timeout=43200, interval=600, batch_size=100, pause=0.05):
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self.run, name='room-reaper', daemon=True)
+                    self._thread.start()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                deleted = reap(self.idle_timeout, self.batch_size, self.pause)
+                if deleted:
+                    logger.info("Reaped %s", ', '.join(f'{count} {label}' for label, count in sorted(deleted.items())))
+            except Exception:
+                logger.exception("Reaper pass failed")
+            finally:
+                close_old_connections()
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+room_reaper = RoomReaper(
+    idle_timeout=getattr(settings, 'ROOM_IDLE_TIMEOUT', 43200),
+    interval=getattr(settings, 'ROOM_REAPER_INTERVAL', 600),
+    batch_size=getattr(settings, 'ROOM_REAPER_BATCH_SIZE', 100),
+    pause=getattr(settings, 'ROOM_REAPER_BATCH_PAUSE', 0.05),
+)
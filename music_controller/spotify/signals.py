@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from music_controller.shared_state import shared_state
+from .cache import token_cache
+from .models import SpotifyToken
+
+
+@receiver(post_save, sender=SpotifyToken)
+@receiver(post_delete, sender=SpotifyToken)
+def invalidate_cached_tokens(sender, instance, **kwargs):
+    token_cache.invalidate(instance.user)
+    shared_state.put('token', instance.user)
+
+
+def token_changed_elsewhere(user, value=None):
+    token_cache.invalidate(user)
+
+
+shared_state.subscribe('token', token_changed_elsewhere)
@@ -1,3 +1,960 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.cache import room_cache
+from api.changes import room_changes
+from api.etags import etag_version, state_version
+from api.membership import COOKIE_NAME, issue_token
+from api.models import Room
+from music_controller.shared_state import SQLiteStateStore
+from . import util
+from .cache import NowPlayingCache, now_playing_cache, token_cache
+from .client import SpotifyClient
+from .command_queue import PAUSE, PLAY, SKIP, CommandQueue
+from .fake_spotify import FakeSpotify
+from .loadtest import percentile
+from .poller import PlaybackPoller
+from .query_audit import audit_queries
+from .ratelimit import RateLimited, UpstreamDispatcher, parse_retry_after
+from .reaper import reap
+from .tokens import refresh_expiring_tokens
+from .versions import SongVersions, next_poll_ms, song_versions
+from .votes import AlreadySkipped, AlreadyVoted, cast_vote, current_votes
+from .models import SpotifyToken, Vote, VoteTally
+from .views import room_state_events
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class NowPlayingCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = NowPlayingCache(ttl=2.0, clock=self.clock)
+
+    def test_hit_within_ttl_extrapolates_progress(self):
+        payload = {'is_playing': True, 'progress_ms': 1000, 'item': {'duration_ms': 5000}}
+        self.cache.get('ABCDEF', lambda: payload)
+        self.clock.now = 1.5
+        result = self.cache.get('ABCDEF', lambda: self.fail('should not refetch'))
+        self.assertEqual(result['progress_ms'], 2500)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_progress_is_clamped_and_frozen_when_paused(self):
+        self.cache.get('A', lambda: {'is_playing': True, 'progress_ms': 4000, 'item': {'duration_ms': 5000}})
+        self.cache.get('B', lambda: {'is_playing': False, 'progress_ms': 4000, 'item': {'duration_ms': 5000}})
+        self.clock.now = 1.9
+        self.assertEqual(self.cache.get('A', dict)['progress_ms'], 5000)
+        self.assertEqual(self.cache.get('B', dict)['progress_ms'], 4000)
+
+    def test_expired_entry_is_refetched(self):
+        self.cache.get('A', lambda: {'n': 1})
+        self.clock.now = 2.0
+        self.assertEqual(self.cache.get('A', lambda: {'n': 2}), {'n': 2})
+        self.assertEqual(self.cache.stats()['misses'], 2)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return {'n': 1}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get('A', fetch))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while self.cache.stats()['coalesced'] < 7:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'n': 1}] * 8)
+
+    def test_interrupted_leader_fails_its_waiters(self):
+        started, release, errors = threading.Event(), threading.Event(), []
+
+        def fetch():
+            started.set()
+            release.wait()
+            raise KeyboardInterrupt
+
+        def wait():
+            try:
+                self.cache.get('A', lambda: {'n': 2})
+            except BaseException as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=lambda: self.assertRaises(KeyboardInterrupt, self.cache.get, 'A', fetch))
+        leader.start()
+        started.wait()
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        while self.cache.stats()['coalesced'] < 1:
+            pass
+        release.set()
+        leader.join()
+        waiter.join()
+
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], KeyboardInterrupt)
+        self.assertEqual(self.cache.get('A', lambda: {'n': 3}), {'n': 3})
+
+    def test_failed_fetch_is_not_cached(self):
+        def fail():
+            raise ValueError('upstream down')
+
+        with self.assertRaises(ValueError):
+            self.cache.get('A', fail)
+        self.assertEqual(self.cache.get('A', lambda: {'n': 1}), {'n': 1})
+
+
+class RoomStateEventsTests(TestCase):
+    async def test_only_changes_are_pushed(self):
+        room = await Room.objects.acreate(host='host-session', votes_to_skip=2)
+        song = {'id': 'song-1', 'is_playing': True, 'votes': 0, 'votes_required': 2, 'time': 0}
+        states = [song, dict(song, time=1000), dict(song, votes=1), None]
+
+        with mock.patch('spotify.views.aget_room_song', side_effect=states):
+            events = room_state_events(room.code, recheck=0)
+            frames = [await anext(events) for _ in range(4)]
+
+        self.assertTrue(frames[0].startswith('retry:'))
+        self.assertEqual(json.loads(frames[1].split('data: ')[1])['votes'], 0)
+        self.assertEqual(json.loads(frames[2].split('data: ')[1])['votes'], 1)
+        self.assertTrue(frames[3].startswith('event: idle'))
+
+    async def test_changes_wake_the_stream(self):
+        room = await Room.objects.acreate(host='host-session', votes_to_skip=2)
+        song = {'id': 'song-1', 'is_playing': True, 'votes': 0, 'votes_required': 2, 'time': 0}
+
+        with mock.patch('spotify.views.aget_room_song', side_effect=[song, dict(song, votes=1)]):
+            events = room_state_events(room.code, recheck=30)
+            await anext(events)
+            await anext(events)
+            started = time.monotonic()
+            pending = asyncio.ensure_future(anext(events))
+            await asyncio.sleep(0.05)
+            self.assertFalse(pending.done())
+            room_changes.notify(room.code)
+            frame = await pending
+
+        self.assertEqual(json.loads(frame.split('data: ')[1])['votes'], 1)
+        self.assertLess(time.monotonic() - started, 5)
+
+    async def test_stream_closes_when_room_is_deleted(self):
+        room = await Room.objects.acreate(host='host-session')
+        events = room_state_events(room.code, recheck=30)
+        with mock.patch('spotify.views.aget_room_song', return_value=None):
+            await anext(events)
+            self.assertTrue((await anext(events)).startswith('event: idle'))
+        closed = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0.05)
+        await room.adelete()
+        self.assertTrue((await closed).startswith('event: closed'))
+
+
+class StandInSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except BrokenPipeError:
+            pass  # The client timed out first.
+
+    def do_GET(self):
+        self.server.peers.add(self.client_address)
+        if self.path.endswith('/slow'):
+            time.sleep(0.5)
+        self._reply({'item': {'id': 'song-1'}, 'auth': self.headers['Authorization']})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self._reply({'access_token': 'fresh', 'token_type': 'Bearer', 'expires_in': 3600})
+
+
+class SpotifyClientTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInSpotifyHandler)
+        cls.server.peers = set()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}/'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.peers.clear()
+        self.client = SpotifyClient(self.base_url + 'v1/me/', self.base_url, read_timeout=0.2)
+        patcher = mock.patch.object(util, 'spotify_client', self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.client.close)
+        SpotifyToken.objects.create(
+            user='host', access_token='stale', refresh_token='refresh',
+            token_type='Bearer', expires_in=timezone.now() - timedelta(seconds=1),
+        )
+
+    def test_sync_requests_reuse_one_connection(self):
+        for _ in range(3):
+            response = util.execute_spotify_api_request('host', 'player/currently-playing')
+        self.assertEqual(response['auth'], 'Bearer stale')
+        self.assertEqual(len(self.server.peers), 1)
+
+    def test_read_timeout_returns_error(self):
+        response = util.execute_spotify_api_request('host', 'player/slow')
+        self.assertIn('Error', response)
+
+    def test_refresh_uses_accounts_service(self):
+        util.refresh_spotify_token('host')
+        self.assertEqual(SpotifyToken.objects.get(user='host').access_token, 'fresh')
+
+
+class PlaybackPollerTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = NowPlayingCache()
+        self.fetches = []
+        self.changes = []
+        self.payload = {'is_playing': True, 'progress_ms': 0, 'item': {'id': 'song-1', 'duration_ms': 60000}}
+        self.poller = PlaybackPoller(
+            self.cache, fetch=self.fetch, on_song_change=lambda code, song_id: self.changes.append(song_id),
+            min_interval=0.01, max_interval=0.05, idle_timeout=0.3,
+        )
+        self.addCleanup(self.poller.stop)
+
+    def fetch(self, host):
+        self.fetches.append(host)
+        return dict(self.payload)
+
+    def test_first_read_waits_for_first_poll_and_later_reads_do_not_fetch(self):
+        self.assertEqual(self.poller.read('ROOM', 'host')['item']['id'], 'song-1')
+        fetches = len(self.fetches)
+        for _ in range(20):
+            self.poller.read('ROOM', 'host')
+        self.assertLessEqual(len(self.fetches), fetches + 1)
+        self.assertEqual(self.changes, ['song-1'])
+
+    def test_idle_room_stops_polling(self):
+        self.poller.read('ROOM', 'host')
+        time.sleep(0.5)
+        self.assertEqual(self.poller.active_rooms(), [])
+        fetches = len(self.fetches)
+        time.sleep(0.1)
+        self.assertEqual(len(self.fetches), fetches)
+        self.assertIsNone(self.cache.peek('ROOM'))
+
+    def test_next_delay_follows_remaining_track_time(self):
+        self.assertEqual(self.poller.next_delay(self.payload), 0.05)
+        ending = dict(self.payload, progress_ms=59980)
+        self.assertEqual(self.poller.next_delay(ending), 0.02)
+        self.assertEqual(self.poller.next_delay(dict(self.payload, is_playing=False)), 0.05)
+
+
+class FakeTokenEndpoint:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def token(self, data):
+        with self.lock:
+            self.calls.append(data['refresh_token'])
+        time.sleep(self.delay)
+        return mock.Mock(status_code=200, json=lambda: {
+            'access_token': 'fresh', 'token_type': 'Bearer', 'expires_in': 3600,
+        })
+
+
+class RevokedTokenEndpoint(FakeTokenEndpoint):
+    def token(self, data):
+        self.calls.append(data['refresh_token'])
+        return mock.Mock(status_code=400, json=lambda: {'error': 'invalid_grant'})
+
+
+class TokenRefreshTests(TransactionTestCase):
+    def make_token(self, user, expires_in_seconds):
+        return SpotifyToken.objects.create(
+            user=user, access_token='stale', refresh_token=f'refresh-{user}',
+            token_type='Bearer', expires_in=timezone.now() + timedelta(seconds=expires_in_seconds),
+        )
+
+    def test_concurrent_refreshes_post_once(self):
+        self.make_token('host', -1)
+        endpoint = FakeTokenEndpoint(delay=0.2)
+        errors = []
+
+        def refresh():
+            try:
+                util.refresh_spotify_token('host')
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch.object(util, 'spotify_client', endpoint):
+            threads = [threading.Thread(target=refresh) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(endpoint.calls, ['refresh-host'])
+        self.assertEqual(SpotifyToken.objects.get(user='host').access_token, 'fresh')
+
+    def test_refreshes_from_threads_and_async_callers_post_once(self):
+        self.make_token('host', -1)
+        endpoint = FakeTokenEndpoint(delay=0.2)
+
+        async def refresh_async():
+            await asyncio.gather(*(
+                sync_to_async(util.refresh_spotify_token, thread_sensitive=False)('host') for _ in range(3)
+            ))
+
+        with mock.patch.object(util, 'spotify_client', endpoint):
+            threads = [threading.Thread(target=util.refresh_spotify_token, args=('host',)) for _ in range(2)]
+            threads.append(threading.Thread(target=async_to_sync(refresh_async)))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(endpoint.calls, ['refresh-host'])
+
+    def test_only_tokens_inside_margin_are_refreshed(self):
+        for user, expires_in_seconds in (('expired', -10), ('expiring', 60), ('fresh', 3000)):
+            self.make_token(user, expires_in_seconds)
+            Room.objects.create(host=user)
+        self.make_token('left', -10)  # Its host has no room any more.
+        endpoint = FakeTokenEndpoint()
+
+        with mock.patch.object(util, 'spotify_client', endpoint):
+            self.assertEqual(refresh_expiring_tokens(margin=300, batch_size=1), 2)
+
+        self.assertEqual(endpoint.calls, ['refresh-expired', 'refresh-expiring'])
+
+    def test_failing_hosts_back_off(self):
+        self.make_token('revoked', -10)
+        Room.objects.create(host='revoked')
+        endpoint = RevokedTokenEndpoint()
+        failures, now = {}, [0]
+
+        def refresh(at):
+            now[0] = at
+            return refresh_expiring_tokens(margin=300, failures=failures, backoff=60, clock=lambda: now[0])
+
+        with mock.patch.object(util, 'spotify_client', endpoint), self.assertLogs('spotify.tokens') as logs:
+            for at in (0, 30, 61, 150, 182):
+                self.assertEqual(refresh(at), 0)
+
+        self.assertEqual(len(endpoint.calls), 3)  # At 0, 61 (after 60 s) and 182 (after 120 s).
+        self.assertEqual(failures['revoked'][0], 3)
+        self.assertIsNotNone(logs.records[0].exc_info)
+        self.assertEqual([record.exc_info for record in logs.records[1:]], [None, None])
+
+        with mock.patch.object(util, 'spotify_client', FakeTokenEndpoint()):
+            self.assertEqual(refresh(10000), 1)
+        self.assertEqual(failures, {})
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+
+    def make_token(self, expires_in_seconds=3600):
+        return SpotifyToken.objects.create(
+            user='host', access_token='first', refresh_token='refresh',
+            token_type='Bearer', expires_in=timezone.now() + timedelta(seconds=expires_in_seconds),
+        )
+
+    def test_warm_lookup_skips_the_database(self):
+        self.make_token()
+        util.get_user_tokens('host')
+        with self.assertNumQueries(0):
+            self.assertEqual(util.get_user_tokens('host').access_token, 'first')
+
+    def test_updates_and_deletes_invalidate(self):
+        self.make_token()
+        util.get_user_tokens('host')
+        util.update_or_create_user_tokens('host', 'second', 'Bearer', 3600, 'refresh')
+        self.assertEqual(util.get_user_tokens('host').access_token, 'second')
+
+        SpotifyToken.objects.get(user='host').delete()
+        self.assertIsNone(util.get_user_tokens('host'))
+
+    def test_tokens_near_expiry_are_reread(self):
+        self.make_token(expires_in_seconds=30)
+        util.get_user_tokens('host')
+        with self.assertNumQueries(1):
+            util.get_user_tokens('host')
+
+
+class VoteLedgerTests(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(host='host', votes_to_skip=2, current_song='song-1')
+
+    def test_threshold_vote_skips_exactly_once(self):
+        self.assertEqual(cast_vote(self.room, 'a', 'song-1'), (1, False))
+        self.assertEqual(cast_vote(self.room, 'b', 'song-1'), (2, True))
+        with self.assertRaises(AlreadySkipped):
+            cast_vote(self.room, 'c', 'song-1')
+        self.assertEqual(current_votes(self.room, 'song-1'), 2)
+
+    def test_duplicate_vote_is_rejected_without_counting(self):
+        cast_vote(self.room, 'a', 'song-1')
+        with self.assertRaises(AlreadyVoted):
+            cast_vote(self.room, 'a', 'song-1')
+        self.assertEqual(current_votes(self.room, 'song-1'), 1)
+        self.assertEqual(Vote.objects.count(), 1)
+
+    def test_user_can_vote_on_other_songs_and_rooms(self):
+        other = Room.objects.create(host='other-host', votes_to_skip=5)
+        cast_vote(self.room, 'a', 'song-1')
+        cast_vote(self.room, 'a', 'song-2')
+        cast_vote(other, 'a', 'song-1')
+        self.assertEqual(Vote.objects.filter(user='a').count(), 3)
+
+    def test_song_change_clears_votes_and_tallies(self):
+        cast_vote(self.room, 'a', 'song-1')
+        util.update_room_song(self.room, 'song-2')
+        self.assertEqual(current_votes(self.room, 'song-1'), 0)
+        self.assertFalse(VoteTally.objects.exists())
+        self.assertFalse(Vote.objects.exists())
+
+
+@override_settings(SPOTIFY_BACKGROUND_POLLING=False, SPOTIFY_TOKEN_REFRESH_IN_BACKGROUND=False)
+class PlayingRoomTestCase(TestCase):
+    """A room in the session whose host is playing ``song-1``, without upstream calls."""
+
+    def setUp(self):
+        room_cache.clear()
+        now_playing_cache.clear()
+        self.addCleanup(room_cache.clear)
+        self.addCleanup(now_playing_cache.clear)
+        self.room = Room.objects.create(host='host', votes_to_skip=2, current_song='song-1')
+        session = self.client.session
+        session['room_code'] = self.room.code
+        session.save()
+        self.play('song-1', 1000)
+
+    def play(self, song_id, progress_ms):
+        now_playing_cache.publish(self.room.code, {
+            'is_playing': True, 'progress_ms': progress_ms,
+            'item': {'id': song_id, 'name': song_id, 'duration_ms': 200000, 'artists': [], 'album': {'images': [{}]}},
+        })
+
+
+class ConditionalCurrentSongTests(PlayingRoomTestCase):
+
+    def test_progress_alone_does_not_change_the_etag(self):
+        first = self.client.get('/spotify/current-song')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('timestamp', first.json())
+        self.play('song-1', 5000)
+        with self.assertNumQueries(1):  # The session row; room, votes and playback are cached.
+            second = self.client.get('/spotify/current-song', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+
+    def test_votes_change_the_etag(self):
+        first = self.client.get('/spotify/current-song')
+        cast_vote(self.room, 'guest', 'song-1')
+        second = self.client.get('/spotify/current-song', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['votes'], 1)
+
+
+class ProgressContractTests(PlayingRoomTestCase):
+    def setUp(self):
+        song_versions.clear()
+        super().setUp()
+
+    def test_version_moves_only_when_the_state_does(self):
+        first = self.client.get('/spotify/current-song').json()
+        self.play('song-1', 6000)
+        progressed = self.client.get('/spotify/current-song').json()
+        self.assertEqual(progressed['version'], first['version'])
+        self.assertAlmostEqual(progressed['time'], 6000, delta=100)  # Advanced since it was published.
+
+        self.play('song-2', 0)
+        changed = self.client.get('/spotify/current-song').json()
+        self.assertGreater(changed['version'], first['version'])
+
+    def test_next_poll_is_timed_to_the_end_of_the_track(self):
+        self.play('song-1', 199000)
+        self.assertAlmostEqual(self.client.get('/spotify/current-song').json()['next_poll_ms'], 1500, delta=100)
+
+
+class RoomStatesTests(PlayingRoomTestCase):
+    def rooms(self, count):
+        rooms = [Room.objects.create(host=f'host-{count}-{i}', votes_to_skip=3) for i in range(count)]
+        for room in rooms:
+            now_playing_cache.publish(room.code, {
+                'is_playing': True, 'progress_ms': 0,
+                'item': {'id': f'{room.code}-song', 'name': 'x', 'duration_ms': 200000, 'artists': [], 'album': {'images': [{}]}},
+            })
+            cast_vote(room, 'guest', f'{room.code}-song')
+        return rooms
+
+    def test_states_for_many_rooms(self):
+        cast_vote(self.room, 'guest', 'song-1')
+        idle = Room.objects.create(host='idle')
+        response = self.client.get('/spotify/room-states', {'codes': f'{self.room.code},NOPE,{idle.code},{self.room.code}'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['missing'], ['NOPE'])
+        self.assertEqual(list(body['rooms']), [self.room.code, idle.code])
+        playing = body['rooms'][self.room.code]
+        self.assertEqual((playing['votes_to_skip'], playing['song']['id'], playing['song']['votes']), (2, 'song-1', 1))
+        self.assertIsNone(body['rooms'][idle.code]['song'])
+
+        again = self.client.get('/spotify/room-states', {'codes': f'{self.room.code},NOPE,{idle.code}'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_votes_left_on_an_old_song_are_not_counted(self):
+        cast_vote(self.room, 'guest', 'song-0')
+        response = self.client.get('/spotify/room-states', {'codes': self.room.code})
+        self.assertEqual(response.json()['rooms'][self.room.code]['song']['votes'], 0)
+
+    def test_queries_do_not_grow_with_the_number_of_rooms(self):
+        for count in (1, 40):
+            codes = ','.join(room.code for room in self.rooms(count))
+            with self.assertNumQueries(3):  # The session row, rooms, then tallies.
+                body = self.client.get('/spotify/room-states', {'codes': codes}).json()
+            self.assertEqual({state['song']['votes'] for state in body['rooms'].values()}, {1})
+
+    @override_settings(ROOM_STATES_MAX_CODES=2)
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get('/spotify/room-states').status_code, 400)
+        self.assertEqual(self.client.get('/spotify/room-states', {'codes': 'A,B,C'}).status_code, 400)
+
+
+class PollHintTests(SimpleTestCase):
+    def song(self, **fields):
+        return dict({'is_playing': True, 'time': 0, 'duration': 180000, 'votes': 0}, **fields)
+
+    def test_versions_only_move_forward(self):
+        clock = FakeClock()
+        clock.now = 100.0
+        versions = SongVersions(clock=clock)
+        self.assertEqual(versions.observe('ROOM', 'a'), (100000, 100.0))
+        clock.now = 99.0  # The wall clock stepped back.
+        self.assertEqual(versions.observe('ROOM', 'b')[0], 100001)
+        clock.now = 200.0
+        self.assertEqual(versions.observe('ROOM', 'b')[0], 100001)
+
+    def test_active_rooms_are_polled_more_often(self):
+        self.assertEqual(next_poll_ms(self.song(), changed_at=90.0, now=100.0), 3000)
+        self.assertEqual(next_poll_ms(self.song(votes=1), changed_at=0.0, now=100.0), 3000)
+        self.assertEqual(next_poll_ms(self.song(), changed_at=0.0, now=100.0), 15000)
+        self.assertEqual(next_poll_ms(self.song(is_playing=False), changed_at=0.0, now=100.0), 15000)
+
+    def test_a_quiet_track_costs_an_order_of_magnitude_fewer_requests(self):
+        # The old client fetched once a second: 180 requests for a three-minute track.
+        requests, elapsed = 0, 0
+        while elapsed < 180000:
+            requests += 1
+            progress = min(elapsed, 180000)
+            elapsed += next_poll_ms(self.song(time=progress), changed_at=-60.0, now=elapsed / 1000)
+        self.assertLessEqual(requests, 18)
+
+
+class LongPollCurrentSongTests(PlayingRoomTestCase):
+    def setUp(self):
+        super().setUp()
+        self.async_client.cookies[settings.SESSION_COOKIE_NAME] = self.client.session.session_key
+
+    async def test_stale_version_is_answered_at_once(self):
+        response = await self.async_client.get('/spotify/current-song', {'wait': 30, 'since': 'outdated'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], 'song-1')
+
+    async def test_waits_for_the_next_change(self):
+        etag = (await self.async_client.get('/spotify/current-song'))['ETag']
+        started = time.monotonic()
+        poll = asyncio.ensure_future(self.async_client.get('/spotify/current-song', {'wait': 30, 'since': etag}))
+        await asyncio.sleep(0.1)
+        self.assertFalse(poll.done())
+        await sync_to_async(cast_vote)(self.room, 'guest', 'song-1')
+        response = await poll
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['votes'], 1)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertLess(time.monotonic() - started, 5)
+
+    async def test_unchanged_state_times_out_with_304(self):
+        etag = (await self.async_client.get('/spotify/current-song'))['ETag']
+        response = await self.async_client.get('/spotify/current-song', {'wait': 0.2, 'since': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    async def test_body_version_works_as_since(self):
+        version = (await self.async_client.get('/spotify/current-song')).json()['version']
+        since = f'v{version}'
+        response = await self.async_client.get('/spotify/current-song', {'wait': 0.2, 'since': since})
+        self.assertEqual(response.status_code, 304)
+        poll = asyncio.ensure_future(self.async_client.get('/spotify/current-song', {'wait': 30, 'since': since}))
+        await asyncio.sleep(0.1)
+        self.assertFalse(poll.done())
+        await sync_to_async(cast_vote)(self.room, 'guest', 'song-1')
+        response = await poll
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.json()['version'], version)
+
+    async def test_all_digit_etags_are_not_body_versions(self):
+        def digits(*parts):
+            return str(int(state_version(*parts), 16))[:20]
+
+        with mock.patch('api.etags.state_version', digits), mock.patch('spotify.views.state_version', digits):
+            etag = (await self.async_client.get('/spotify/current-song'))['ETag']
+            self.assertTrue(etag_version(etag).isdigit())
+            await sync_to_async(cast_vote)(self.room, 'guest', 'song-1')
+            response = await self.async_client.get('/spotify/current-song', {'wait': 30, 'since': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['votes'], 1)
+
+    async def test_wait_must_be_a_finite_number(self):
+        for wait in ('soon', 'nan', 'inf', '-inf'):
+            response = await self.async_client.get('/spotify/current-song', {'wait': wait})
+            self.assertEqual(response.status_code, 400, wait)
+            self.assertEqual(response.json(), {'error': 'wait must be a number of seconds.'})
+
+
+@override_settings(ROOM_MEMBERSHIP_TOKENS=True)
+class MembershipTokenSkipTests(PlayingRoomTestCase):
+    def test_votes_are_cast_as_the_token_identity_without_a_session(self):
+        del self.client.cookies[settings.SESSION_COOKIE_NAME]
+        self.client.cookies[COOKIE_NAME] = issue_token(self.room.code, 'guest-1')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post('/spotify/skip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Vote.objects.get().user, 'guest-1')
+        self.assertFalse([q['sql'] for q in captured if 'django_session' in q['sql']])
+
+
+class ReaperTests(TestCase):
+    def make_token(self, user, expires_in_seconds=3600):
+        return SpotifyToken.objects.create(
+            user=user, access_token='a', refresh_token='r', token_type='Bearer',
+            expires_in=timezone.now() + timedelta(seconds=expires_in_seconds),
+        )
+
+    def test_idle_rooms_are_deleted_in_batches_with_their_votes(self):
+        idle = [Room.objects.create(host=f'idle-{i}', current_song='song') for i in range(3)]
+        Room.objects.filter(pk__in=[room.pk for room in idle]).update(last_activity=timezone.now() - timedelta(hours=2))
+        live = Room.objects.create(host='live', current_song='song')
+        cast_vote(idle[0], 'guest', 'song')
+        cast_vote(live, 'guest', 'song')
+
+        deleted = reap(idle_timeout=3600, batch_size=2)
+
+        self.assertEqual(deleted['api.Room'], 3)
+        self.assertEqual(deleted['spotify.Vote'], 1)
+        self.assertEqual(list(Room.objects.all()), [live])
+        self.assertEqual(Vote.objects.get().room, live)
+
+    def test_stale_votes_orphaned_tokens_and_expired_sessions(self):
+        room = Room.objects.create(host='host', current_song='song-2')
+        Vote.objects.create(room=room, user='guest', song_id='song-1')
+        Vote.objects.create(room=room, user='guest', song_id='song-2')
+        VoteTally.objects.create(room=room, song_id='song-1', count=1)
+        self.make_token('host')
+        self.make_token('gone')
+        Session.objects.create(session_key='old', session_data='', expire_date=timezone.now() - timedelta(days=1))
+
+        reap(idle_timeout=3600)
+
+        self.assertEqual(list(Vote.objects.values_list('song_id', flat=True)), ['song-2'])
+        self.assertFalse(VoteTally.objects.exists())
+        self.assertEqual(list(SpotifyToken.objects.values_list('user', flat=True)), ['host'])
+        self.assertFalse(Session.objects.exists())
+
+
+class CommandQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+        self.gate = threading.Event()
+        self.state = None
+        self.queue = CommandQueue(self.execute, state=lambda code: self.state, workers=2)
+        self.addCleanup(self.queue.stop)
+
+    def execute(self, host, action):
+        self.gate.wait(5)
+        self.sent.append(action)
+        return {}
+
+    def finish(self):
+        self.gate.set()
+        self.queue.stop()
+
+    def test_contradictory_toggles_collapse_to_the_last(self):
+        first = self.queue.enqueue('ROOM', 'host', PAUSE)  # Held in flight by the gate.
+        while self.queue.stats()['queued']:
+            time.sleep(0.01)
+        ids = [self.queue.enqueue('ROOM', 'host', action) for action in (PLAY, PAUSE, PLAY)]
+        self.finish()
+        self.assertEqual(self.sent, [PAUSE, PLAY])
+        self.assertEqual([self.queue.outcome(i) for i in [first] + ids], ['sent', 'coalesced', 'coalesced', 'sent'])
+
+    def test_commands_the_state_already_satisfies_are_dropped(self):
+        self.state = {'is_playing': True, 'item': {'id': 'song-2'}}
+        play = self.queue.enqueue('ROOM', 'host', PLAY)
+        skip = self.queue.enqueue('ROOM', 'host', SKIP, 'song-1')
+        self.finish()
+        self.assertEqual(self.sent, [])
+        self.assertEqual((self.queue.outcome(play), self.queue.outcome(skip)), ('dropped', 'dropped'))
+
+    def test_a_song_is_skipped_once(self):
+        first = self.queue.enqueue('ROOM', 'host', SKIP, 'song-1')
+        self.assertEqual(self.queue.enqueue('ROOM', 'host', SKIP, 'song-1'), first)
+        self.finish()
+        later = self.queue.enqueue('ROOM', 'host', SKIP, 'song-1')
+        self.queue.stop()
+        self.assertEqual(self.sent, [SKIP])
+        self.assertEqual(self.queue.outcome(later), 'dropped')
+
+    def test_failures_are_logged_once(self):
+        def explode(host, action):
+            raise ConnectionError('reset')
+
+        queue = CommandQueue(explode, workers=1)
+        self.addCleanup(queue.stop)
+        with self.assertLogs('spotify.command_queue') as logs:
+            command = queue.enqueue('ROOM', 'host', PLAY)
+            queue.stop()
+        self.assertEqual(queue.outcome(command), 'failed')
+        self.assertEqual(len(logs.records), 1)
+        self.assertIsNotNone(logs.records[0].exc_info)
+
+    def test_spotify_error_bodies_fail_the_command(self):
+        applied = []
+        body = {'error': {'status': 404, 'message': 'Player command failed: No active device found', 'reason': 'NO_ACTIVE_DEVICE'}}
+        queue = CommandQueue(lambda host, action: body, on_applied=lambda code, action: applied.append(action), workers=1)
+        self.addCleanup(queue.stop)
+        skip = queue.enqueue('ROOM', 'host', SKIP, 'song-1')
+        queue.stop()
+        self.assertEqual(queue.outcome(skip), 'failed')
+        self.assertEqual(queue.stats()['failed'], 1)
+        self.assertEqual(applied, [])
+        self.assertNotEqual(queue.enqueue('ROOM', 'host', SKIP, 'song-1'), skip)  # Not remembered as skipped.
+        queue.stop()
+        self.assertEqual(queue.stats()['failed'], 2)
+
+
+class QueuedCommandViewTests(PlayingRoomTestCase):
+    def test_pause_is_accepted_with_a_command_id(self):
+        self.room.guest_can_pause = True
+        self.room.save(update_fields=['guest_can_pause'])
+        queue = CommandQueue(lambda host, action: {}, workers=1)
+        self.addCleanup(queue.stop)
+        with mock.patch('spotify.views.playback_commands', queue):
+            response = self.client.put('/spotify/pause')
+        self.assertEqual(response.status_code, 202)
+        self.assertIn(queue.outcome(response.json()['command_id']), ('queued', 'sent'))
+
+
+class SpotifyAuthViewTests(PlayingRoomTestCase):
+    def test_is_authenticated_refreshes_an_expired_token(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        user = self.client.session.session_key
+        SpotifyToken.objects.create(
+            user=user, access_token='stale', refresh_token='refresh', token_type='Bearer',
+            expires_in=timezone.now() - timedelta(seconds=1),
+        )
+        endpoint = FakeTokenEndpoint()
+        with mock.patch.object(util, 'spotify_client', endpoint):
+            response = self.client.get('/spotify/is-authenticated')
+        self.assertEqual(response.json(), {'status': True})
+        self.assertEqual(endpoint.calls, ['refresh'])
+        self.assertEqual(SpotifyToken.objects.get(user=user).access_token, 'fresh')
+
+    def test_failed_authorization_is_a_json_error(self):
+        response = self.client.get('/spotify/redirect', {'error': 'access_denied'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Authorization failed.'})
+
+
+class QueryPlanTests(TestCase):
+    def test_view_queries_do_not_scan_full_tables(self):
+        results = audit_queries()
+        self.assertTrue(results)
+        self.assertEqual([(label, sql) for label, sql, plan, scans in results if scans], [])
+
+    def test_other_backends_are_refused(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            with self.assertRaises(ValueError):
+                audit_queries()
+            with self.assertRaisesMessage(CommandError, 'SQLite query plans only'):
+                call_command('explain_queries')
+
+
+class SharedStateTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'shared.sqlite3')
+        # Two stores on one file stand in for two worker processes.
+        self.first, self.second = SQLiteStateStore(path, interval=0.005), SQLiteStateStore(path, interval=0.005)
+        self.addCleanup(self.first.stop)
+        self.addCleanup(self.second.stop)
+
+    def wait_for(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.005)
+
+    def test_changes_reach_the_other_process_only(self):
+        received = []
+        self.second.subscribe('room', lambda key, value: received.append(key))
+        self.second.ensure_started()
+        self.second.put('room', 'OWN')
+        self.first.put('room', 'ABCDEF')
+        self.wait_for(lambda: received)
+        time.sleep(0.05)
+        self.assertEqual(received, ['ABCDEF'])
+        self.assertIsNone(self.second.get('room', 'ABCDEF'))
+
+    def test_one_process_holds_a_lease(self):
+        self.assertTrue(self.first.claim('poll:A', 10))
+        self.assertFalse(self.second.claim('poll:A', 10))
+        self.assertTrue(self.first.claim('poll:A', 10))
+        self.assertTrue(self.first.claim('poll:B', -1))
+        self.assertTrue(self.second.claim('poll:B', 10))
+
+    def test_workers_share_one_upstream_poll(self):
+        fetched = []
+
+        def fetch(host):
+            fetched.append(host)
+            return {'is_playing': True, 'progress_ms': 0, 'item': {'id': f'song-{len(fetched)}'}}
+
+        pollers = []
+        for store in (self.first, self.second):
+            poller = PlaybackPoller(NowPlayingCache(), fetch, min_interval=60, max_interval=60, store=store)
+            self.addCleanup(poller.stop)
+            store.subscribe('now_playing', poller.receive)
+            store.ensure_started()
+            pollers.append(poller)
+
+        self.assertEqual(pollers[0].read('ROOM', 'host')['item']['id'], 'song-1')
+        self.assertEqual(pollers[1].read('ROOM', 'host')['item']['id'], 'song-1')
+        self.assertEqual(len(fetched), 1)
+
+        pollers[0].refresh('ROOM')
+        self.wait_for(lambda: pollers[1].cache.peek('ROOM')['item']['id'] == 'song-2')
+        self.assertEqual(len(fetched), 2)
+
+
+class UpstreamDispatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.dispatcher = UpstreamDispatcher(
+            global_rate=100, global_burst=100, host_rate=1, host_burst=4, command_reserve=2, clock=self.clock,
+        )
+
+    def test_background_polls_leave_room_for_commands(self):
+        self.dispatcher.acquire('host', background=True)
+        self.dispatcher.acquire('host', background=True)
+        with self.assertRaises(RateLimited):
+            self.dispatcher.acquire('host', background=True)
+        self.dispatcher.acquire('host')
+        self.dispatcher.acquire('host')
+        with self.assertRaises(RateLimited):
+            self.dispatcher.acquire('host', timeout=0)
+        self.dispatcher.acquire('other-host', background=True)
+
+    def test_retry_after_blocks_every_host(self):
+        self.dispatcher.record(429, '3')
+        with self.assertRaises(RateLimited) as raised:
+            self.dispatcher.acquire('other-host', background=True)
+        self.assertEqual(raised.exception.retry_after, 3)
+        self.clock.now = 3
+        self.dispatcher.acquire('other-host', background=True)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(parse_retry_after('7'), 7)
+        self.assertEqual(parse_retry_after(None), 1.0)
+        self.assertEqual(parse_retry_after('Thu, 01 Jan 1970 00:00:00 GMT'), 0)
+
+    def test_poller_keeps_last_state_while_throttled(self):
+        cache = NowPlayingCache()
+        cache.publish('ROOM', {'item': {'id': 'song-1'}})
+
+        def fetch(host):
+            raise RateLimited(30)
+
+        poller = PlaybackPoller(cache, fetch=fetch, max_interval=0.05)
+        self.addCleanup(poller.stop)
+        self.assertEqual(poller.read('ROOM', 'host')['item']['id'], 'song-1')
+        time.sleep(0.1)
+        self.assertEqual(poller.polls, 1)
+        self.assertEqual(cache.peek('ROOM')['item']['id'], 'song-1')
+
+
+class FakeSpotifyTests(SimpleTestCase):
+    def test_player_commands_change_state(self):
+        with FakeSpotify() as fake:
+            client = SpotifyClient(fake.url + 'v1/me/', fake.url)
+            self.addCleanup(client.close)
+            first = client.api('a', 'player/currently-playing').json()
+            self.assertTrue(first['is_playing'])
+            self.assertEqual(client.api('a', 'player/pause', 'PUT').status_code, 204)
+            self.assertFalse(client.api('a', 'player/currently-playing').json()['is_playing'])
+            client.api('a', 'player/next', 'POST')
+            self.assertNotEqual(client.api('a', 'player/currently-playing').json()['item']['id'], first['item']['id'])
+            self.assertEqual(client.token({'code': 'xyz'}).json()['access_token'], 'access-xyz')
+            self.assertEqual(fake.calls['GET /v1/me/player/currently-playing'], 3)
+
+    def test_rate_limit_responses_carry_retry_after(self):
+        with FakeSpotify(rate_limit_rate=1.0, retry_after=4) as fake:
+            client = SpotifyClient(fake.url + 'v1/me/', fake.url)
+            self.addCleanup(client.close)
+            response = client.api('a', 'player/currently-playing')
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], '4')
+
+    def test_percentile(self):
+        self.assertEqual(percentile(list(range(100)), 50), 50)
+        self.assertEqual(percentile(list(range(100)), 99), 99)
+        self.assertEqual(percentile([], 95), 0.0)
@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from api.models import Room
+from .models import SpotifyToken
+from .util import refresh_spotify_token
+
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_expiring_tokens(margin, batch_size=50, failures=None, backoff=60, max_backoff=3600, clock=time.monotonic):
+    """Refresh every host token expiring within ``margin`` seconds, ``batch_size`` hosts per query.
+
+    Returns the number of tokens refreshed. Tokens whose host no longer owns a
+    room are left alone. Failures are logged and skipped so one revoked host
+    does not hold up the rest; with a ``failures`` dict kept between passes, a
+    host that keeps failing is retried after ``backoff`` seconds, doubling up
+    to ``max_backoff``, and only its first failure is logged with a traceback.
+    """
+    if failures is None:
+        failures = {}
+    now = clock()
+    attempted = {user for user, (count, retry_at) in failures.items() if retry_at > now}
+    refreshed = 0
+    while True:
+        deadline = timezone.now() + timedelta(seconds=margin)
+        batch = list(
+            SpotifyToken.objects.filter(expires_in__lte=deadline, user__in=Room.objects.values('host'))
+            .exclude(user__in=attempted)
+            .order_by('expires_in')
+            .values_list('user', flat=True)[:batch_size]
+        )
+        if not batch:
+            break
+        for user in batch:
+            attempted.add(user)
+            try:
+                refresh_spotify_token(user)
+            except Exception as e:
+                count = failures[user][0] + 1 if user in failures else 1
+                delay = min(backoff * 2 ** (count - 1), max_backoff)
+                failures[user] = (count, clock() + delay)
+                if count == 1:
+                    logger.exception("Refreshing Spotify token for %s failed; retrying in %ds", user, delay)
+                else:
+                    logger.warning(
+                        "Refreshing Spotify token for %s failed %d times; retrying in %ds: %s", user, count, delay, e,
+                    )
+            else:
+                failures.pop(user, None)
+                refreshed += 1
+    for user in set(failures) - attempted:  # No longer expiring, or its room is gone.
+        del failures[user]
+    return refreshed
+
+
+class TokenRefresher:
+    """Background thread that renews host tokens ``margin`` seconds before they expire."""
+
+    def __init__(self, margin=300, interval=60, batch_size=50, max_backoff=3600):
+        self.margin = margin
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+        self.failures = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self.run, name='token-refresher', daemon=True)
+                    self._thread.start()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                refresh_expiring_tokens(
+                    self.margin, self.batch_size, self.failures, backoff=self.interval, max_backoff=self.max_backoff,
+                )
+            except Exception:
+                logger.exception("Token refresh pass failed")
+            finally:
+                close_old_connections()
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+token_refresher = TokenRefresher(
+    margin=getattr(settings, 'SPOTIFY_TOKEN_REFRESH_MARGIN', 300),
+    interval=getattr(settings, 'SPOTIFY_TOKEN_REFRESH_INTERVAL', 60),
+    batch_size=getattr(settings, 'SPOTIFY_TOKEN_REFRESH_BATCH_SIZE', 50),
+    max_backoff=getattr(settings, 'SPOTIFY_TOKEN_REFRESH_MAX_BACKOFF', 3600),
+)
@@ -5,7 +5,10 @@ urlpatterns = [
     path('get-auth-url', AuthURLView.as_view()),
     path('redirect', spotify_callback),
     path('is-authenticated', IsAuthenticated.as_view()),
-    path('current-song', CurrentSong.as_view()),
+    path('current-song', current_song),
+    path('current-song/stream', current_song_stream),
+    path('room-states', RoomStates.as_view()),
+    path('cache-stats', NowPlayingCacheStats.as_view()),
     path('pause', PauseSong.as_view()),
     path('play', PlaySong.as_view()),
     path('skip', SkipSong.as_view()),
@@ -1,23 +1,53 @@
 from .models import SpotifyToken
+from .votes import clear_votes
 from django.utils import timezone
 from datetime import timedelta
+from contextlib import contextmanager
+import threading
 from .credentials import CLIENT_ID, CLIENT_SECRET
-from requests import post, put, get
+from .client import spotify_client
+from .cache import token_cache
+from .ratelimit import RateLimited, parse_retry_after, upstream_dispatcher
+from requests import RequestException
 
 
-BASE_URL = "https://api.spotify.com/v1/me/"
+_refresh_locks = {}
+_refresh_locks_guard = threading.Lock()
 
 
-def get_user_tokens(session_id):
-    """Retrieve the Spotify token for a given session."""
-    user_tokens = SpotifyToken.objects.filter(user=session_id)
-    return user_tokens.first() if user_tokens.exists() else None
+@contextmanager
+def _refresh_lock(session_id):
+    """Serialise token refreshes per user; the lock is dropped once nobody holds or waits on it."""
+    with _refresh_locks_guard:
+        entry = _refresh_locks.setdefault(session_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _refresh_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _refresh_locks[session_id]
+
+
+def get_user_tokens(session_id, use_cache=True):
+    """Retrieve the Spotify token for a given session, from the in-process cache when warm."""
+    if use_cache:
+        tokens = token_cache.get(session_id)
+        if tokens is not None:
+            return tokens
+
+    tokens = SpotifyToken.objects.filter(user=session_id).first()
+    if use_cache and tokens is not None:
+        token_cache.set(session_id, tokens)
+    return tokens
 
 
 def update_or_create_user_tokens(session_id, access_token, token_type, expires_in, refresh_token):
     """Save or update the user's Spotify tokens."""
     expires_at = timezone.now() + timedelta(seconds=expires_in)
-    tokens = get_user_tokens(session_id)
+    tokens = get_user_tokens(session_id, use_cache=False)
 
     if tokens:
         tokens.access_token = access_token
@@ -46,60 +76,86 @@ def is_spotify_authenticated(session_id):
 
 
 def refresh_spotify_token(session_id):
-    """Refresh the user's Spotify access token using the refresh token."""
+    """Refresh the user's Spotify access token using the refresh token.
+
+    Concurrent callers for the same user wait for a single refresh instead of each
+    POSTing their own.
+    """
     tokens = get_user_tokens(session_id)
     if not tokens:
         raise ValueError("No tokens available to refresh.")
+    seen_expiry = tokens.expires_in
+
+    with _refresh_lock(session_id):
+        tokens = get_user_tokens(session_id, use_cache=False)
+        if not tokens:
+            raise ValueError("No tokens available to refresh.")
+        if tokens.expires_in != seen_expiry:
+            return  # Another caller refreshed while we waited.
 
-    response = post(
-        'https://accounts.spotify.com/api/token',
-        data={
+        response = spotify_client.token({
             'grant_type': 'refresh_token',
             'refresh_token': tokens.refresh_token,
             'client_id': CLIENT_ID,
             'client_secret': CLIENT_SECRET,
-        },
-        timeout=10,
-    )
+        })
+
+        if response.status_code != 200:
+            raise ValueError(f"Failed to refresh token: {response.json()}")
+
+        response_data = response.json()
+        update_or_create_user_tokens(
+            session_id,
+            access_token=response_data['access_token'],
+            token_type=response_data['token_type'],
+            expires_in=response_data['expires_in'],
+            refresh_token=response_data.get('refresh_token', tokens.refresh_token)
+        )
+
+
+def _api_method(post_, put_):
+    if post_:
+        return 'POST'
+    if put_:
+        return 'PUT'
+    return 'GET'
+
 
-    if response.status_code != 200:
-        raise ValueError(f"Failed to refresh token: {response.json()}")
+def _parse_api_response(response):
+    try:
+        return response.json() if response.content else {}
+    except Exception as e:
+        return {'Error': f'Issue with request: {str(e)}'}
 
-    response_data = response.json()
-    update_or_create_user_tokens(
-        session_id,
-        access_token=response_data['access_token'],
-        token_type=response_data['token_type'],
-        expires_in=response_data['expires_in'],
-        refresh_token=response_data.get('refresh_token', tokens.refresh_token)
-    )
 
+def execute_spotify_api_request(session_id, endpoint, post_=False, put_=False, background=False):
+    """Execute a Spotify API request.
 
-def execute_spotify_api_request(session_id, endpoint, post_=False, put_=False):
-    """Execute a Spotify API request."""
+    Calls go through the upstream rate limiter. Background calls (now-playing polls)
+    raise :class:`RateLimited` instead of waiting so callers can serve the last known
+    state; commands wait briefly and otherwise get an error payload.
+    """
     tokens = get_user_tokens(session_id)
     if not tokens:
         return {'Error': 'User is not authenticated with Spotify'}
 
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': f"Bearer {tokens.access_token}"
-    }
-
-    url = BASE_URL + endpoint
-
-    if post_:
-        response = post(url, headers=headers)
-    elif put_:
-        response = put(url, headers=headers)
-    else:
-        response = get(url, headers=headers)
+    try:
+        upstream_dispatcher.acquire(session_id, background=background)
+    except RateLimited as e:
+        if background:
+            raise
+        return {'Error': str(e)}
 
     try:
-        return response.json() if response.content else {}
-    except Exception as e:
+        response = spotify_client.api(tokens.access_token, endpoint, _api_method(post_, put_))
+    except RequestException as e:
         return {'Error': f'Issue with request: {str(e)}'}
 
+    upstream_dispatcher.record(response.status_code, response.headers.get('Retry-After'))
+    if response.status_code == 429 and background:
+        raise RateLimited(parse_retry_after(response.headers.get('Retry-After')))
+    return _parse_api_response(response)
+
 
 def play_song(session_id):
     """Send a request to play a song on Spotify."""
@@ -114,3 +170,11 @@ def pause_song(session_id):
 def skip_song(session_id):
     """Send a request to skip to the next song on Spotify."""
     return execute_spotify_api_request(session_id, "player/next", post_=True)
+
+
+def update_room_song(room, song_id):
+    """Record a new current song for the room and clear votes cast on the previous one."""
+    if room.current_song != song_id:
+        room.current_song = song_id
+        room.save(update_fields=['current_song'])
+        clear_votes(room)
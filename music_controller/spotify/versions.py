@@ -0,0 +1,64 @@
+import threading
+import time
+
+from django.conf import settings
+
+
+class SongVersions:
+    """Per-room version numbers for the playback state listeners see.
+
+    :meth:`observe` is handed the state key of every payload built for a room
+    and returns a version that only moves forward, and only when the key
+    changes. A version is the wall-clock millisecond at which this process
+    first saw the state, so versions are kept per process: two workers stamp
+    the same change a little apart, and a worker that is behind can stamp an
+    older state later than another worker stamped a newer one.
+    """
+
+    def __init__(self, max_rooms=4096, clock=time.time):
+        self.max_rooms = max_rooms
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rooms = {}
+
+    def observe(self, code, key):
+        """Return ``(version, changed_at)`` for room ``code`` whose current state key is ``key``."""
+        with self._lock:
+            seen = self._rooms.get(code)
+            if seen is not None and seen[0] == key:
+                return seen[1], seen[2]
+            now = self._clock()
+            version = int(now * 1000)
+            if seen is not None:
+                version = max(version, seen[1] + 1)
+            self._rooms[code] = (key, version, now)
+            while len(self._rooms) > self.max_rooms:
+                del self._rooms[next(iter(self._rooms))]
+            return version, now
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+
+
+def next_poll_ms(song, changed_at, now):
+    """How long a client can go before asking for ``song``'s room again, in milliseconds.
+
+    Clients advance progress themselves, so a playing track only needs a fresh
+    read when it ends. Rooms whose state changed within
+    ``SPOTIFY_CLIENT_ACTIVE_WINDOW`` seconds, or with skip votes pending, are
+    asked about more often than quiet ones.
+    """
+    active = now - changed_at < getattr(settings, 'SPOTIFY_CLIENT_ACTIVE_WINDOW', 30.0) or song.get('votes')
+    if active:
+        delay = getattr(settings, 'SPOTIFY_CLIENT_POLL_ACTIVE_INTERVAL', 3.0)
+    else:
+        delay = getattr(settings, 'SPOTIFY_CLIENT_POLL_MAX_INTERVAL', 15.0)
+    duration, progress = song.get('duration'), song.get('time')
+    if song.get('is_playing') and isinstance(duration, int) and isinstance(progress, int):
+        delay = min(delay, (duration - progress) / 1000 + 0.5)  # Just after the track ends.
+    delay = max(getattr(settings, 'SPOTIFY_CLIENT_POLL_MIN_INTERVAL', 1.0), delay)
+    return int(delay * 1000)
+
+
+song_versions = SongVersions()
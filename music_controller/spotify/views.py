@@ -1,13 +1,35 @@
+import asyncio
+import logging
+import math
+import time
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import redirect
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.http import HttpResponseRedirect, JsonResponse
-from requests import post, get, Request
+from django.conf import settings
+from django.http import HttpResponseNotModified, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from requests import Request
 from .util import *
 from .credentials import CLIENT_ID, CLIENT_SECRET, REDIRECT_URI
+from api.cache import acached_room, cached_room, room_cache
+from api.changes import room_changes
+from api.etags import etag_version, make_etag, not_modified, state_version, tag_response
+from api.membership import aget_room_code, get_room_code, get_user_id
 from api.models import Room
-from .models import Vote
+from api.renderers import FastJsonResponse, dumps
+from .votes import AlreadySkipped, AlreadyVoted, cast_vote, current_votes, mark_skipped, room_tallies
+from .cache import now_playing_cache
+from .client import spotify_client
+from .command_queue import (
+    PAUSE, PLAY, SKIP, playback_command_queue_enabled, playback_commands, send_playback_command,
+)
+from .poller import aread_now_playing, playback_changed, playback_poller, polling_enabled, read_now_playing
+from .versions import next_poll_ms, song_versions
+
+
+logger = logging.getLogger(__name__)
 
 
 class AuthURLView(APIView):
@@ -33,24 +55,20 @@ def spotify_callback(request):
     error = request.GET.get('error')
 
     if error or not code:
-        return Response({'error': 'Authorization failed.'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'error': 'Authorization failed.'}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        response = post(
-            'https://accounts.spotify.com/api/token',
-            data={
-                'grant_type': 'authorization_code',
-                'code': code,
-                'redirect_uri': REDIRECT_URI,
-                'client_id': CLIENT_ID,
-                'client_secret': CLIENT_SECRET,
-            },
-            timeout=10,
-        )
+        response = spotify_client.token({
+            'grant_type': 'authorization_code',
+            'code': code,
+            'redirect_uri': REDIRECT_URI,
+            'client_id': CLIENT_ID,
+            'client_secret': CLIENT_SECRET,
+        })
         response_data = response.json()
 
         if response.status_code != 200:
-            return Response({'error': 'Failed to retrieve tokens.'}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({'error': 'Failed to retrieve tokens.'}, status=status.HTTP_400_BAD_REQUEST)
 
         access_token = response_data['access_token']
         token_type = response_data['token_type']
@@ -66,7 +84,7 @@ def spotify_callback(request):
         return HttpResponseRedirect('/')
 
     except Exception as e:
-        return Response({'error': f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({'error': f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 class IsAuthenticated(APIView):
@@ -82,63 +100,274 @@ class IsAuthenticated(APIView):
 class CurrentSong(APIView):
     """Get the current song playing on Spotify."""
     def get(self, request, format=None):
-        room_code = request.session.get('room_code')
-        room = Room.objects.filter(code=room_code).first()
+        room = cached_room(get_room_code(request))
 
         if not room:
             return Response({'error': 'Room not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        host = room.host
-        endpoint = "player/currently-playing"
-        response = execute_spotify_api_request(host, endpoint)
-
-        if 'error' in response or 'item' not in response:
-            return Response({'error': 'No song currently playing.'}, status=status.HTTP_204_NO_CONTENT)
+        song = get_room_song(room)
+        etag = make_etag(*song_version_parts(room, song))
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+        if song is None:
+            return tag_response(Response({'error': 'No song currently playing.'}, status=status.HTTP_204_NO_CONTENT), etag)
+        return tag_response(FastJsonResponse(song, status=status.HTTP_200_OK), etag)
 
-        item = response.get('item')
-        duration = item.get('duration_ms')
-        progress = response.get('progress_ms')
-        album_cover = item.get('album', {}).get('images', [{}])[0].get('url')
-        is_playing = response.get('is_playing')
-        song_id = item.get('id')
 
-        artist_string = ', '.join(artist.get('name', 'Unknown') for artist in item.get('artists', []))
+async def current_song(request):
+    """Get the current song; ``?wait=<seconds>&since=<version>`` holds the request until it changes.
 
-        votes = Vote.objects.filter(room=room, song_id=song_id).count()
-        song = {
-            'title': item.get('name', 'Unknown'),
-            'artist': artist_string,
-            'duration': duration,
-            'time': progress,
-            'image_url': album_cover,
-            'is_playing': is_playing,
-            'votes': votes,
-            'votes_required': room.votes_to_skip,
-            'id': song_id,
-        }
+    ``since`` names the state the client already has: the ETag (or the version
+    inside it), or ``v<version>`` with the ``version`` of the last body.
+    Requests without ``wait`` are answered by :class:`CurrentSong`.
+    """
+    if request.method != 'GET' or 'wait' not in request.GET:
+        return await sync_to_async(CurrentSong.as_view())(request)
 
-        self.update_room_song(room, song_id)
+    room_code = await aget_room_code(request)
+    try:
+        wait = float(request.GET['wait'])
+    except ValueError:
+        wait = math.nan
+    if not math.isfinite(wait):
+        return JsonResponse({'error': 'wait must be a number of seconds.'}, status=status.HTTP_400_BAD_REQUEST)
+    wait = min(max(wait, 0.0), getattr(settings, 'SPOTIFY_LONG_POLL_MAX_WAIT', 60.0))
+    since = etag_version(request.GET.get('since', ''))
+    recheck = getattr(settings, 'SPOTIFY_POLL_MAX_INTERVAL', 5.0)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        seen = room_changes.seq(room_code)
+        room, song = await _aread_room_song(room_code)
+        if room is None:
+            return JsonResponse({'error': 'Room not found.'}, status=status.HTTP_404_NOT_FOUND)
+        version = state_version(*song_version_parts(room, song))
+        unchanged = client_has_song(since, version, song)
+        remaining = deadline - loop.time()
+        if not unchanged or remaining <= 0:
+            break
+        # Re-read at least every poll interval; that also keeps the room's poller alive.
+        await room_changes.wait(room_code, seen, min(remaining, recheck))
+
+    etag = f'W/"{version}"'
+    if unchanged:
+        return tag_response(HttpResponseNotModified(), etag)
+    if song is None:
+        return tag_response(JsonResponse({'error': 'No song currently playing.'}, status=status.HTTP_204_NO_CONTENT), etag)
+    return tag_response(FastJsonResponse(song), etag)
+
+
+def client_has_song(since, version, song):
+    """Whether a long-poll's ``since`` already names the state ``song`` with ETag version ``version``.
+
+    ``since`` is an ETag version, or ``v`` and a body ``version``. Body
+    versions only move forward, so one at least as new as the song's counts as
+    current too.
+    """
+    if since == version:
+        return True
+    body_version = since[1:] if since.startswith('v') else ''
+    return body_version.isdigit() and song is not None and song['version'] <= int(body_version)
+
+
+async def _aread_room_song(room_code):
+    room = await acached_room(room_code)
+    return room, await aget_room_song(room) if room else None
+
+
+def get_room_song(room):
+    """Build the now-playing payload for a room, or None if nothing is playing."""
+    response = read_now_playing(room)
+
+    if 'error' in response or 'item' not in response:
+        return None
+
+    song_id = response.get('item').get('id')
+    votes = room_cache.get(room.code, ('votes', song_id), lambda: current_votes(room, song_id))
+    return song_payload(room, response, votes)
+
+
+async def aget_room_song(room):
+    response = await aread_now_playing(room)
+
+    if 'error' in response or 'item' not in response:
+        return None
+
+    song_id = response.get('item').get('id')
+    votes = await room_cache.aget(room.code, ('votes', song_id), lambda: sync_to_async(current_votes)(room, song_id))
+    return song_payload(room, response, votes)
+
+
+def song_payload(room, response, votes):
+    """The current-song body for a raw currently-playing ``response``."""
+    item = response.get('item')
+    duration = item.get('duration_ms')
+    progress = response.get('progress_ms')
+    album_cover = item.get('album', {}).get('images', [{}])[0].get('url')
+    is_playing = response.get('is_playing')
+    song_id = item.get('id')
+
+    artist_string = ', '.join(artist.get('name', 'Unknown') for artist in item.get('artists', []))
+
+    now = time.time()
+    song = {
+        'title': item.get('name', 'Unknown'),
+        'artist': artist_string,
+        'duration': duration,
+        'time': progress,
+        'timestamp': int(now * 1000),
+        'image_url': album_cover,
+        'is_playing': is_playing,
+        'votes': votes,
+        'votes_required': room.votes_to_skip,
+        'id': song_id,
+    }
+    song['version'], changed_at = song_versions.observe(room.code, song_state_key(song))
+    song['next_poll_ms'] = next_poll_ms(song, changed_at, now)
+
+    return song
+
+
+def song_version_parts(room, song):
+    """What a room's current-song ETag and long-poll version are computed over."""
+    return room.pk, song_state_key(song)
+
+
+def song_state_key(song):
+    """The parts of a now-playing payload whose change is worth pushing to listeners.
+
+    Progress is left out: ``time`` was sampled at server time ``timestamp`` and
+    clients advance it themselves while ``is_playing``. So are ``version`` and
+    ``next_poll_ms``, which are derived from this key.
+    """
+    if song is None:
+        return None
+    return (song['id'], song['is_playing'], song['votes'], song['votes_required'])
+
+
+async def room_state_events(room_code, recheck=None, heartbeat=15.0):
+    """Yield SSE frames for a room whenever its song, play state or vote tally changes.
+
+    Between frames the stream sleeps on :data:`room_changes`, re-reading at
+    least every ``SPOTIFY_POLL_MAX_INTERVAL`` seconds so the room's poller
+    stays alive while someone listens.
+    """
+    if recheck is None:
+        recheck = getattr(settings, 'SPOTIFY_POLL_MAX_INTERVAL', 5.0)
+    loop = asyncio.get_running_loop()
+    last_key = False
+    last_frame = loop.time()
+    yield 'retry: 3000\n\n'
+    while True:
+        seen = room_changes.seq(room_code)
+        room = await acached_room(room_code)
+        if room is None:
+            yield 'event: closed\ndata: {}\n\n'
+            return
+
+        song = await aget_room_song(room)
+        key = song_state_key(song)
+        if key != last_key:
+            last_key = key
+            last_frame = loop.time()
+            if song is None:
+                yield 'event: idle\ndata: {}\n\n'
+            else:
+                yield f'event: song\ndata: {dumps(song).decode()}\n\n'
+        elif loop.time() - last_frame >= heartbeat:
+            last_frame = loop.time()
+            yield ': keep-alive\n\n'
+
+        await room_changes.wait(room_code, seen, min(recheck, heartbeat))
+
+
+async def current_song_stream(request):
+    """Stream the caller's room's playback state as Server-Sent Events."""
+    room = await acached_room(await aget_room_code(request))
+
+    if not room:
+        return JsonResponse({'error': 'Room not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = StreamingHttpResponse(room_state_events(room.code), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class RoomStates(APIView):
+    """Settings, now-playing and votes for many rooms at once, e.g. for a venue dashboard.
+
+    ``?codes=A,B,C`` names up to ``ROOM_STATES_MAX_CODES`` rooms. However many
+    there are, rooms take one query and vote tallies another; playback comes
+    from the now-playing cache, never from Spotify inside the request. With
+    background polling on, asking keeps each room's poller alive like any
+    listener does.
+    """
+    def get(self, request, format=None):
+        codes = list(dict.fromkeys(code.strip() for code in request.GET.get('codes', '').split(',') if code.strip()))
+        if not codes:
+            return Response({'error': 'codes must name at least one room.'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = getattr(settings, 'ROOM_STATES_MAX_CODES', 100)
+        if len(codes) > limit:
+            return Response({'error': f'At most {limit} codes per request.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rooms = {room.code: room for room in Room.objects.filter(code__in=codes)}
+        playing = {}
+        for code, room in rooms.items():
+            if polling_enabled():
+                playback_poller.touch(code, room.host)
+            response = now_playing_cache.peek(code) or {}
+            if 'error' not in response and response.get('item'):
+                playing[code] = response
+        tallies = room_tallies((rooms[code], response['item'].get('id')) for code, response in playing.items())
+
+        states, parts = {}, []
+        for code in codes:
+            room = rooms.get(code)
+            if room is None:
+                continue
+            song = None
+            if code in playing:
+                song = song_payload(room, playing[code], tallies.get(room.pk, 0))
+            states[code] = {'guest_can_pause': room.guest_can_pause, 'votes_to_skip': room.votes_to_skip, 'song': song}
+            parts.append((code, room.guest_can_pause, song_version_parts(room, song)))
+        etag = make_etag(parts)
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+        missing = [code for code in codes if code not in rooms]
+        return tag_response(Response({'rooms': states, 'missing': missing}, status=status.HTTP_200_OK), etag)
+
+
+class NowPlayingCacheStats(APIView):
+    """Expose hit/miss counters of the shared now-playing cache."""
+    def get(self, request, format=None):
+        return Response(now_playing_cache.stats(), status=status.HTTP_200_OK)
 
-        return Response(song, status=status.HTTP_200_OK)
 
-    def update_room_song(self, room, song_id):
-        if room.current_song != song_id:
-            room.current_song = song_id
-            room.save(update_fields=['current_song'])
-            Vote.objects.filter(room=room).delete()
+def run_playback_command(room, action, song_id=None):
+    """Queue ``action`` for the room's player and return its command id, or send it now if queueing is off."""
+    if playback_command_queue_enabled():
+        return playback_commands.enqueue(room.code, room.host, action, song_id)
+    send_playback_command(room.host, action)
+    playback_changed(room.code)
+    return None
 
 
 class PauseSong(APIView):
     """Pause the current song playing on Spotify."""
     def put(self, request, format=None):
-        room_code = request.session.get('room_code')
-        room = Room.objects.filter(code=room_code).first()
+        room = cached_room(get_room_code(request))
 
         if not room:
             return Response({'error': 'Room not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        if request.session.session_key == room.host or room.guest_can_pause:
-            pause_song(room.host)
+        if get_user_id(request) == room.host or room.guest_can_pause:
+            command_id = run_playback_command(room, PAUSE)
+            if command_id:
+                return Response({'message': 'Pause queued', 'command_id': command_id}, status=status.HTTP_202_ACCEPTED)
             return Response({'message': 'Song paused'}, status=status.HTTP_204_NO_CONTENT)
 
         return Response({'error': 'Forbidden.'}, status=status.HTTP_403_FORBIDDEN)
@@ -147,14 +376,15 @@ class PauseSong(APIView):
 class PlaySong(APIView):
     """Play the current song playing on Spotify."""
     def put(self, request, format=None):
-        room_code = request.session.get('room_code')
-        room = Room.objects.filter(code=room_code).first()
+        room = cached_room(get_room_code(request))
 
         if not room:
             return Response({'error': 'Room not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-        if request.session.session_key == room.host or room.guest_can_pause:
-            play_song(room.host)
+        if get_user_id(request) == room.host or room.guest_can_pause:
+            command_id = run_playback_command(room, PLAY)
+            if command_id:
+                return Response({'message': 'Play queued', 'command_id': command_id}, status=status.HTTP_202_ACCEPTED)
             return Response({'message': 'Song playing'}, status=status.HTTP_204_NO_CONTENT)
 
         return Response({'error': 'Forbidden.'}, status=status.HTTP_403_FORBIDDEN)
@@ -164,11 +394,11 @@ class SkipSong(APIView):
     """Skip the current song playing on Spotify."""
 
     def post(self, request, format=None):
-        room_code = request.session.get('room_code')
+        room_code = get_room_code(request)
         if not room_code:
             return Response({'error': 'Room code not found in session.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        room = Room.objects.filter(code=room_code).first()
+        room = cached_room(room_code)
         if not room:
             return Response({'error': 'Room not found.'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -176,34 +406,32 @@ class SkipSong(APIView):
         if not song_id:
             return Response({'error': 'No song currently playing.'}, status=status.HTTP_404_NOT_FOUND)
 
-        user_session = request.session.session_key
+        user_session = get_user_id(request)
 
         # ✅ If the user is the host, just skip the song without voting
         if user_session == room.host:
-            print(f"Host {user_session} is skipping the song directly.")
-            Vote.objects.filter(room=room, song_id=song_id).delete()  # Clear votes
-            skip_song(room.host)
+            logger.info("Host %s is skipping the song directly.", user_session)
+            mark_skipped(room, song_id)  # Close voting on this song
+            command_id = run_playback_command(room, SKIP, song_id)
+            if command_id:
+                return Response({'message': 'Host skip queued!', 'command_id': command_id}, status=status.HTTP_202_ACCEPTED)
             return Response({'message': 'Host skipped the song successfully!'}, status=status.HTTP_200_OK)
 
-        # ✅ Check if the user has already voted
-        existing_vote = Vote.objects.filter(user=user_session, room=room, song_id=song_id).first()
-        
-        if existing_vote:
+        # ✅ Add the vote and decide the skip atomically
+        try:
+            result = cast_vote(room, user_session, song_id)
+        except AlreadyVoted:
             return Response({'error': 'You have already voted to skip this song!'}, status=status.HTTP_400_BAD_REQUEST)
+        except AlreadySkipped:
+            return Response({'message': 'Song is already being skipped.'}, status=status.HTTP_200_OK)
 
-        # ✅ Add vote BEFORE checking the skip condition
-        Vote.objects.create(user=user_session, room=room, song_id=song_id)
-
-        # Fetch updated vote count
-        votes = Vote.objects.filter(room=room, song_id=song_id).count()
-
-        # Debugging logs
-        print(f"Votes needed: {room.votes_to_skip}, Current votes: {votes}, Requesting User: {user_session}")
+        logger.debug("Votes needed: %s, Current votes: %s, Requesting User: %s", room.votes_to_skip, result.votes, user_session)
 
-        # ✅ Check if enough votes have been cast to skip the song
-        if votes >= room.votes_to_skip:
-            Vote.objects.filter(room=room, song_id=song_id).delete()  # Clear votes after skipping
-            skip_song(room.host)  # Skip the song using the Spotify API
+        # ✅ Only the vote that reached the threshold skips the song
+        if result.skip:
+            command_id = run_playback_command(room, SKIP, song_id)  # Skip the song using the Spotify API
+            if command_id:
+                return Response({'message': 'Skip queued!', 'command_id': command_id}, status=status.HTTP_202_ACCEPTED)
             return Response({'message': 'Song skipped successfully!'}, status=status.HTTP_200_OK)
 
-        return Response({'message': f'Your vote has been counted. Votes: {votes}/{room.votes_to_skip}'}, status=status.HTTP_200_OK)
+        return Response({'message': f'Your vote has been counted. Votes: {result.votes}/{room.votes_to_skip}'}, status=status.HTTP_200_OK)
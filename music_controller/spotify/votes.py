@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from api.cache import room_cache
+
+from .models import Vote, VoteTally
+
+
+VoteResult = namedtuple('VoteResult', ['votes', 'skip'])
+
+
+class AlreadyVoted(Exception):
+    """The user has already voted to skip this song."""
+
+
+class AlreadySkipped(Exception):
+    """Enough votes were already cast and the song is being skipped."""
+
+
+def current_votes(room, song_id):
+    """Return the vote tally for ``song_id`` in ``room`` without a COUNT query."""
+    return VoteTally.objects.filter(room=room, song_id=song_id).values_list('count', flat=True).first() or 0
+
+
+def room_tallies(pairs):
+    """Vote counts for many ``(room, song_id)`` pairs in one query, as ``{room.pk: votes}``."""
+    songs = {room.pk: song_id for room, song_id in pairs if song_id}
+    if not songs:
+        return {}
+    rows = VoteTally.objects.filter(room_id__in=songs, song_id__in=set(songs.values())).values_list(
+        'room_id', 'song_id', 'count'
+    )
+    return {room_id: count for room_id, song_id, count in rows if songs[room_id] == song_id}
+
+
+def cast_vote(room, user, song_id):
+    """Record ``user``'s vote to skip ``song_id`` and decide the skip in one transaction.
+
+    Exactly one caller gets ``skip=True`` per song; the caller is expected to issue
+    the upstream skip after the transaction has committed.
+    """
+    with transaction.atomic():
+        tally, _ = VoteTally.objects.get_or_create(room=room, song_id=song_id)
+        if not VoteTally.objects.filter(pk=tally.pk, skipped=False).update(count=F('count') + 1):
+            raise AlreadySkipped()
+
+        try:
+            Vote.objects.create(user=user, room=room, song_id=song_id)
+        except IntegrityError:
+            raise AlreadyVoted()
+
+        votes = VoteTally.objects.filter(pk=tally.pk).values_list('count', flat=True).get()
+        skip = votes >= room.votes_to_skip and bool(
+            VoteTally.objects.filter(pk=tally.pk, skipped=False).update(skipped=True)
+        )
+    room_cache.invalidate(room.code)
+    return VoteResult(votes, skip)
+
+
+def mark_skipped(room, song_id):
+    """Close voting on ``song_id`` because the host skipped it directly."""
+    with transaction.atomic():
+        tally, _ = VoteTally.objects.get_or_create(room=room, song_id=song_id)
+        VoteTally.objects.filter(pk=tally.pk).update(skipped=True)
+    room_cache.invalidate(room.code)
+
+
+def clear_votes(room):
+    """Drop every vote and tally for ``room``, e.g. when its song changes."""
+    Vote.objects.filter(room=room).delete()
+    VoteTally.objects.filter(room=room).delete()
+    room_cache.invalidate(room.code)
+